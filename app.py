@@ -1,134 +1,103 @@
+import uuid
 import streamlit as st
+import numpy as np
 import pandas as pd
-import os
 from datetime import datetime, timedelta
 import plotly.express as px
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib import colors
-from reportlab.lib.styles import ParagraphStyle
-from io import BytesIO
-from statsmodels.tsa.arima.model import ARIMA
-import warnings
+from core import (load_inventory, inventory_for_display, PRICE_CENTS, sales_on, sales_rollups, record_sale,
+                  update_product, delete_product, register_change, run_forecast, forecast_status, forecast_method, FORECASTERS,
+                  stage_inventory_upload, commit_inventory_upload, stage_stock_upload, commit_stock_upload,
+                  request_report_pdf, current_report_pdf, inventory_csv, reorder_status, restock_list, restock_csv,
+                  count_changes, read_changes, search_products, ProductNotFound, InsufficientStock, MAX_QUANTITY)
+from instrumentation import RECORDER, begin_run, label_run, end_run, span
+
+# Each rerun is timed (see instrumentation.py); the key lets an interrupted rerun be closed by the next one
+begin_run(key=st.session_state.setdefault("run_key", uuid.uuid4().hex))
 
 # Initial configuration
 st.set_page_config(page_title="Inventory System", layout="wide")
 st.title("Inventory System - Product Management")
 
-# Files
-INVENTORY_FILE = "inventory.csv"
-HISTORY_FILE = "change_history.csv"
-SALES_FILE = "sales.csv"
 USERS = {"admin": "inventory123"}
-
-# Demo data for generic inventory
-DEMO_DATA = pd.DataFrame({
-    "ID": ["001", "002", "003", "004", "005"],
-    "Product": ["Laptop", "T-shirt", "1kg Rice", "Chair", "LED Bulb"],
-    "Category": ["Electronics", "Clothing", "Food", "Furniture", "Lighting"],
-    "Quantity": [10, 20, 50, 15, 30],
-    "Price": [1200.00, 15.50, 2.80, 45.00, 3.75],
-    "Supplier": ["Dell", "Zara", "Local", "Ikea", "Philips"],
-    "Last Update": ["2025-03-02 10:00:00", "2025-03-01 15:30:00", "2025-02-28 09:15:00", 
-                    "2025-03-01 12:00:00", "2025-03-02 14:20:00"],
-    "Estimated Demand": [0.0, 0.0, 0.0, 0.0, 0.0]
-})
-
-# Demo data for historical sales (30 days)
-start_date = datetime(2025, 2, 1)
-DEMO_SALES = []
-for i in range(30):
-    date = start_date + timedelta(days=i)
-    DEMO_SALES.extend([
-        {"Date": date.strftime("%Y-%m-%d 09:00:00"), "ID": "001", "Product": "Laptop", "Quantity Sold": 1, "Unit Price": 1200.00, "Total": 1200.00, "User": "admin"},
-        {"Date": date.strftime("%Y-%m-%d 10:00:00"), "ID": "002", "Product": "T-shirt", "Quantity Sold": 3, "Unit Price": 15.50, "Total": 46.50, "User": "admin"},
-        {"Date": date.strftime("%Y-%m-%d 11:00:00"), "ID": "003", "Product": "1kg Rice", "Quantity Sold": 5, "Unit Price": 2.80, "Total": 14.00, "User": "admin"},
-        {"Date": date.strftime("%Y-%m-%d 12:00:00"), "ID": "004", "Product": "Chair", "Quantity Sold": 2, "Unit Price": 45.00, "Total": 90.00, "User": "admin"},
-        {"Date": date.strftime("%Y-%m-%d 13:00:00"), "ID": "005", "Product": "LED Bulb", "Quantity Sold": 4, "Unit Price": 3.75, "Total": 15.00, "User": "admin"}
-    ])
-DEMO_SALES = pd.DataFrame(DEMO_SALES)
-
-# Function to load inventory
-def load_inventory():
-    if not os.path.exists(INVENTORY_FILE):
-        DEMO_DATA.to_csv(INVENTORY_FILE, index=False)
-        return DEMO_DATA.copy()
-    df = pd.read_csv(INVENTORY_FILE)
-    df["Price"] = df["Price"].round(2)
-    if "Estimated Demand" not in df.columns:
-        df["Estimated Demand"] = 0.0
-    return df 
-
-# Function to save inventory
-def save_inventory(df):
-    df["Price"] = df["Price"].round(2)
-    df["Estimated Demand"] = df["Estimated Demand"].round(2)
-    df.to_csv(INVENTORY_FILE, index=False)
-
-# Function to load sales
-def load_sales():
-    if not os.path.exists(SALES_FILE):
-        DEMO_SALES.to_csv(SALES_FILE, index=False)
-        return DEMO_SALES.copy()
-    df = pd.read_csv(SALES_FILE)
-    df["Unit Price"] = df["Unit Price"].round(2)
-    df["Total"] = df["Total"].round(2)
-    return df
-
-# Function to save sales
-def save_sales(df):
-    df["Unit Price"] = df["Unit Price"].round(2)
-    df["Total"] = df["Total"].round(2)
-    df.to_csv(SALES_FILE, index=False)
-
-# Register changes in history
-def register_change(action, product_id, user):
-    history = pd.DataFrame({
-        "Date": [datetime.now().strftime("%Y-%m-%d %H:%M:%S")],
-        "Action": [action],
-        "Product ID": [product_id],
-        "User": [user]
-    })
-    if os.path.exists(HISTORY_FILE):
-        existing_history = pd.read_csv(HISTORY_FILE)
-        history = pd.concat([existing_history, history], ignore_index=True)
-    history.to_csv(HISTORY_FILE, index=False)
-
-# Function to calculate estimated demand with ARIMA
-def calculate_estimated_demand(sales, inventory, forecast_periods=30):
-    sales["Date"] = pd.to_datetime(sales["Date"])
-    inventory["Estimated Demand"] = 0.0
-    
-    for id_prod in inventory["ID"].unique():
-        sales_prod = sales[sales["ID"] == id_prod].copy()
-        if not sales_prod.empty and len(sales_prod) >= 10:
-            daily_sales = sales_prod.groupby(sales_prod["Date"].dt.date)["Quantity Sold"].sum().reset_index()
-            daily_sales["Date"] = pd.to_datetime(daily_sales["Date"])
-            daily_sales.set_index("Date", inplace=True)
-            time_series = daily_sales["Quantity Sold"].resample("D").sum().fillna(0)
-            
-            try:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    model = ARIMA(time_series, order=(1, 1, 1))
-                    result = model.fit()
-                    prediction = result.forecast(steps=forecast_periods)
-                    estimated_demand = prediction.mean()
-                    inventory.loc[inventory["ID"] == id_prod, "Estimated Demand"] = estimated_demand
-            except ValueError as e:
-                st.warning(f"ARIMA could not be fitted for ID {id_prod}: {str(e)}.")
-            except Exception as e:
-                st.warning(f"Unexpected error for ID {id_prod}: {str(e)}") 
+# Users who can see the diagnostics panel
+ADMIN_USERS = {"admin"}
+
+# Show the fit warnings returned by calculate_estimated_demand
+def show_forecast_messages(messages, not_enough):
+    for message in messages:
+        st.warning(message)
+    if not_enough:
+        st.info(f"Not enough sales data for {len(not_enough)} product(s): {', '.join(not_enough[:20])}"
+                + (" ..." if len(not_enough) > 20 else ""))
+
+# Stock highlighting for a page of the inventory: red when out of stock, yellow when below the reorder point
+def stock_colors(df):
+    status = reorder_status(df.index).to_numpy()
+    colors = np.select([status == "Out of stock", status == "Reorder"], ["background-color: red", "background-color: yellow"], "")
+    return pd.DataFrame(np.repeat(colors[:, None], df.shape[1], axis=1), index=df.index, columns=df.columns)
+
+# Timings and memory of the recent reruns, for admins
+def show_diagnostics():
+    st.subheader("Diagnostics")
+    runs = RECORDER.runs_frame()
+    st.write("**Recent Reruns** (newest first; the current one is still running)")
+    st.dataframe(runs.style.format({"Seconds": "{:.3f}", "RSS MB": "{:.1f}", "RSS Change MB": "{:+.1f}"}, na_rep=""),
+                 hide_index=True)
+    finished = runs[runs["Status"] != "running"]
+    if not finished.empty:
+        run = st.selectbox("Spans of rerun", finished["Run"].tolist())
+        st.dataframe(RECORDER.spans_frame(run).style.format({"seconds": "{:.4f}", "rss_delta_mb": "{:+.1f}"}, na_rep=""),
+                     hide_index=True)
+    background = RECORDER.spans_frame()
+    if not background.empty:
+        st.write("**Background Spans** (report rendering, downloads)")
+        st.dataframe(background.style.format({"seconds": "{:.4f}", "rss_delta_mb": "{:+.1f}"}, na_rep=""), hide_index=True)
+    st.write("**Totals by Stage** (since the app started)")
+    st.dataframe(RECORDER.summary_frame().style.format({"Total Seconds": "{:.3f}", "Mean Seconds": "{:.4f}",
+                                                        "Max Seconds": "{:.4f}"}), hide_index=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Download Spans (JSON Lines)", data=RECORDER.json_lines,
+                           file_name=f"spans_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl", mime="application/json")
+    with col2:
+        st.download_button("Download Metrics (Prometheus)", data=RECORDER.prometheus_text,
+                           file_name="metrics.prom", mime="text/plain")
+
+# Validate an uploaded CSV once per file and keep the staged import in the session across reruns
+def staged_upload(uploaded_file, mode):
+    key = (uploaded_file.file_id, mode)
+    staged = st.session_state.get("staged_upload")
+    if staged is None or st.session_state.get("staged_upload_key") != key:
+        if staged is not None:
+            staged.discard()
+        st.session_state.staged_upload = None
+        uploaded_file.seek(0)
+        if mode == "stock update":
+            staged = stage_stock_upload(uploaded_file)
         else:
-            st.info(f"Not enough data for ID {id_prod} (minimum 10 sales).")
-    
-    return inventory
+            staged = stage_inventory_upload(uploaded_file, restock=mode == "new products")
+        st.session_state.staged_upload = staged
+        st.session_state.staged_upload_key = key
+    return staged
+
+# Show the row-level errors of a staged import, or its preview; returns True if it can be committed
+def show_staged_upload(staged, title):
+    if staged.error_count:
+        st.error(f"{staged.error_count} invalid row(s). Fix them and upload the file again.")
+        st.dataframe(staged.errors, hide_index=True)
+        if staged.error_count > staged.errors["Line"].nunique():
+            st.caption(f"Only the first {len(staged.errors)} errors are shown.")
+        return False
+    st.write(f"{title} ({staged.rows} product(s), first {len(staged.preview)} shown):")
+    st.dataframe(staged.preview.style.format({"Price": "{:.2f}", "Estimated Demand": "{:.2f}"}, na_rep=""), hide_index=True)
+    return True
 
 # Authentication
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
 
 if not st.session_state.authenticated:
+    label_run(page="Log In")
     st.subheader("Log In")
     st.sidebar.markdown("**Demo Credentials:**")   # Added in the sidebar
     st.sidebar.write("User: `admin`")             # Demo credentials
@@ -143,17 +112,18 @@ if not st.session_state.authenticated:
         else:
             st.error("Incorrect user or password.")
 else:
-    # Load inventory and sales
+    # Load inventory (cached until the stored data changes); pages that need sales load them
     inventory = load_inventory()
-    sales = load_sales()
 
     # Sidebar menu
     menu = st.sidebar.selectbox(
         "Menu",
         ["View Inventory", "Register Sales", "Load Initial Inventory", "Restock", 
-         "Search Product", "Edit Product", "Delete Product", "Report", "History"]
+         "Search Product", "Edit Product", "Delete Product", "Report", "Sales Dashboard", "History"]
     )
+    label_run(page=menu, user=st.session_state.user)
     st.sidebar.write(f"User: {st.session_state.user}")
+    diagnostics = st.session_state.user in ADMIN_USERS and st.sidebar.checkbox("Show diagnostics")
     if st.sidebar.button("Log Out"):
         st.session_state.authenticated = False
         st.session_state.pop("user")
@@ -165,34 +135,46 @@ else:
         if inventory.empty:
             st.warning("The inventory is empty. Please load the initial inventory.")
         else:
+            methods = list(FORECASTERS)
+            method = st.selectbox("Forecasting method", methods, index=methods.index(forecast_method()),
+                                  format_func=str.capitalize, help="ARIMA fits each product separately and is much slower.")
             if st.button("Calculate Estimated Demand"):
-                inventory = calculate_estimated_demand(sales, inventory)
-                save_inventory(inventory)
+                inventory, messages, not_enough = run_forecast(method=method)
+                show_forecast_messages(messages, not_enough)
                 st.success("Estimated demand calculated successfully!")
+            status = forecast_status()
+            if status:
+                st.caption(f"Estimated demand last calculated on {status['Finished']} for {status['Products']} product(s)"
+                           f" ({status.get('Method', 'arima')}).")
 
             col1, col2 = st.columns(2)
             with col1:
-                category_filter = st.selectbox("Filter by Category", ["All"] + inventory["Category"].unique().tolist())
+                category_filter = st.selectbox("Filter by Category", ["All"] + inventory["Category"].cat.categories.tolist())
             with col2:
-                supplier_filter = st.selectbox("Filter by Supplier", ["All"] + inventory["Supplier"].unique().tolist())
+                supplier_filter = st.selectbox("Filter by Supplier", ["All"] + inventory["Supplier"].cat.categories.tolist())
             
-            filtered_inventory = inventory.copy()
+            mask = pd.Series(True, index=inventory.index)
             if category_filter != "All":
-                filtered_inventory = filtered_inventory[filtered_inventory["Category"] == category_filter]
+                mask &= inventory["Category"] == category_filter
             if supplier_filter != "All":
-                filtered_inventory = filtered_inventory[filtered_inventory["Supplier"] == supplier_filter]
-            
-            def color_stock(row):
-                if row["Quantity"] == 0:
-                    return ['background-color: red'] * len(row)
-                elif row["Quantity"] < 5:
-                    return ['background-color: yellow'] * len(row)
-                return [''] * len(row)
-            
-            st.dataframe(filtered_inventory.style.apply(color_stock, axis=1).format({"Price": "{:.2f}", "Estimated Demand": "{:.2f}"}))
+                mask &= inventory["Supplier"] == supplier_filter
+            filtered_inventory = inventory[mask]
+
+            # Only the current page is styled and sent to the browser
+            page_size = st.selectbox("Rows per page", [25, 50, 100, 500], index=1)
+            total_pages = max((len(filtered_inventory) + page_size - 1) // page_size, 1)
+            if st.session_state.get("inventory_page", 1) > total_pages:
+                # A new filter or page size left the page out of range
+                st.session_state.inventory_page = 1
+            page = st.number_input("Page", min_value=1, max_value=total_pages, step=1, key="inventory_page")
+            page_rows = inventory_for_display(filtered_inventory.iloc[(page - 1) * page_size:page * page_size])
+            with span("render_inventory_page", rows=len(page_rows)):
+                st.dataframe(page_rows.style.apply(stock_colors, axis=None).format({"Price": "{:.2f}", "Estimated Demand": "{:.2f}"}), hide_index=True)
+            st.caption(f"{len(filtered_inventory)} product(s) (page {page} of {total_pages}).")
+            # The CSV is only written when the button is clicked
             st.download_button(
                 label="Download Inventory as CSV",
-                data=filtered_inventory.to_csv(index=False),
+                data=lambda: inventory_csv(filtered_inventory),
                 file_name=f"inventory_{datetime.now().strftime('%Y%m%d')}.csv",
                 mime="text/csv"
             )
@@ -200,57 +182,35 @@ else:
     # Option 2: Register Sales
     elif menu == "Register Sales":
         st.subheader("Register Today's Sales")
-        inventory["ID"] = inventory["ID"].astype(str)
-        available_products = [f"{row['Product']} (ID: {row['ID']}, Stock: {row['Quantity']})" 
-                              for _, row in inventory.iterrows() if row['Quantity'] > 0]
+        in_stock = inventory[inventory["Quantity"] > 0]
+        product_labels = dict(zip(in_stock.index, in_stock["Product"].astype(str) + " (ID: " + in_stock["ID"]
+                                  + ", Stock: " + in_stock["Quantity"].astype(str) + ")"))
         
         with st.form(key="sales_form"):
-            if available_products:
-                selected_product = st.selectbox("Select a Product", available_products)
+            if product_labels:
+                sale_id = st.selectbox("Select a Product", list(product_labels), format_func=product_labels.get)
                 quantity_sold = st.number_input("Quantity Sold", min_value=1, step=1)
                 submit_sale = st.form_submit_button(label="Register Sale")
 
                 if submit_sale:
                     try:
-                        sale_id = selected_product.split("ID: ")[1].split(",")[0].strip()
-                        if sale_id in inventory["ID"].values:
-                            product = inventory[inventory["ID"] == sale_id].iloc[0]
-                            if product["Quantity"] >= quantity_sold:
-                                inventory.loc[inventory["ID"] == sale_id, "Quantity"] -= quantity_sold
-                                inventory.loc[inventory["ID"] == sale_id, "Last Update"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                save_inventory(inventory)
-
-                                total_sale = quantity_sold * product["Price"]
-                                new_sale = pd.DataFrame({
-                                    "Date": [datetime.now().strftime("%Y-%m-%d %H:%M:%S")],
-                                    "ID": [sale_id],
-                                    "Product": [product["Product"]],
-                                    "Quantity Sold": [quantity_sold],
-                                    "Unit Price": [product["Price"]],
-                                    "Total": [total_sale],
-                                    "User": [st.session_state.user]
-                                })
-                                sales = pd.concat([sales, new_sale], ignore_index=True)
-                                save_sales(sales)
-
-                                register_change("Sale", sale_id, st.session_state.user)
-                                st.success(f"Sale registered: {quantity_sold} of '{product['Product']}' for ${total_sale:.2f}")
-                                inventory = load_inventory()
-                            else:
-                                st.error(f"Not enough stock. Available: {product['Quantity']}")
-                        else:
-                            st.error(f"The ID '{sale_id}' was not found in the inventory.")
-                    except IndexError:
-                        st.error("Error processing the selected product.")
+                        sale = record_sale(sale_id, quantity_sold, st.session_state.user)
+                        st.success(f"Sale registered: {quantity_sold} of '{sale['Product']}' for ${sale['Total']:.2f}")
+                        inventory = load_inventory()
+                    except InsufficientStock as e:
+                        st.error(f"Not enough stock. Available: {e.available}")
+                    except ProductNotFound:
+                        st.error(f"The ID '{sale_id}' was not found in the inventory.")
             else:
                 st.warning("No products with available stock to sell.")
 
         st.subheader("Sales Registered Today")
-        today = datetime.now().strftime("%Y-%m-%d")
-        sales_today = sales[sales["Date"].str.startswith(today)]
+        today = pd.Timestamp.now().normalize()
+        sales_today = sales_on(today)
         if not sales_today.empty:
-            st.dataframe(sales_today.style.format({"Unit Price": "{:.2f}", "Total": "{:.2f}"}))
-            daily_total = sales_today["Total"].sum()
+            st.dataframe(sales_today.style.format({"Unit Price": "{:.2f}", "Total": "{:.2f}", "Date": "{:%Y-%m-%d %H:%M:%S}"}),
+                         hide_index=True)
+            daily_total = sales_rollups().get("daily", today)["Revenue"]
             st.write(f"**Today's Total Sales:** ${daily_total:.2f}")
         else:
             st.info("No sales registered for today.")
@@ -276,45 +236,22 @@ else:
           - All fields are mandatory.
           - IDs must be unique.
           - If the file contains the optional column `Estimated Demand`, it must be a number with up to 2 decimals; otherwise, it will be set to 0.0.
+          - Invalid rows are listed by line number; nothing is loaded until every row is valid.
         """)
 
         uploaded_file = st.file_uploader("Select a CSV file", type=["csv"])
         if uploaded_file is not None:
             try:
-                new_inventory = pd.read_csv(uploaded_file)
-                required_columns = ["ID", "Product", "Category", "Quantity", "Price", "Supplier", "Last Update"]
-                
-                if not all(col in new_inventory.columns for col in required_columns):
-                    st.error(f"The CSV must contain all required columns: {', '.join(required_columns)}.")
+                try:
+                    staged = staged_upload(uploaded_file, "initial")
+                except ValueError as e:
+                    st.error(str(e))
                 else:
-                    try:
-                        new_inventory["Quantity"] = new_inventory["Quantity"].astype(int)
-                        new_inventory["Price"] = new_inventory["Price"].astype(float)
-                        pd.to_datetime(new_inventory["Last Update"], format="%Y-%m-%d %H:%M:%S")
-                    except ValueError as e:
-                        st.error(f"Error in data: {str(e)}. Verify that 'Quantity' is an integer, 'Price' is a number, and 'Last Update' is in format `YYYY-MM-DD HH:MM:SS`.")
-                    else:
-                        if new_inventory["ID"].duplicated().any():
-                            st.error("The CSV contains duplicate IDs. Each ID must be unique.")
-                        elif new_inventory["Quantity"].lt(0).any():
-                            st.error("The 'Quantity' column cannot contain negative values.")
-                        elif new_inventory["Price"].lt(0).any():
-                            st.error("The 'Price' column cannot contain negative values.")
-                        else:
-                            new_inventory["Price"] = new_inventory["Price"].round(2)
-                            if "Estimated Demand" not in new_inventory.columns:
-                                new_inventory["Estimated Demand"] = 0.0
-                            else:
-                                new_inventory["Estimated Demand"] = new_inventory["Estimated Demand"].fillna(0.0).round(2)
-                            
-                            st.write("Preview of the initial inventory:")
-                            st.dataframe(new_inventory.style.format({"Price": "{:.2f}", "Estimated Demand": "{:.2f}"}))
-                            if st.button("Confirm Load"):
-                                inventory = new_inventory.copy()
-                                save_inventory(inventory)
-                                register_change("Load Initial Inventory", "All", st.session_state.user)
-                                st.success("Initial inventory loaded successfully!")
-                                inventory = load_inventory()
+                    if show_staged_upload(staged, "Preview of the initial inventory") and st.button("Confirm Load"):
+                        commit_inventory_upload(staged, st.session_state.user)
+                        st.session_state.staged_upload = None
+                        st.success("Initial inventory loaded successfully!")
+                        inventory = load_inventory()
             except pd.errors.EmptyDataError:
                 st.error("The CSV file is empty.")
             except pd.errors.ParserError:
@@ -325,67 +262,70 @@ else:
     # Option 4: Restock
     elif menu == "Restock":
         st.subheader("Restock from CSV")
-        st.markdown("""
-        **Instructions for the CSV file:**
-        - **Required columns (in this order):** `ID`, `Product`, `Category`, `Quantity`, `Price`, `Supplier`, `Last Update`.
-        - **Column format:**
-          - `ID`: Unique identifier of the product (text, maximum 10 characters).
-          - `Product`: Name of the product (text).
-          - `Category`: Category of the product (text).
-          - `Quantity`: Quantity to add to inventory (integer ≥ 1).
-          - `Price`: Unit price of the product (number with up to 2 decimals).
-          - `Supplier`: Name of the supplier (text).
-          - `Last Update`: Date and time of the last update (format `YYYY-MM-DD HH:MM:SS`).
-        - **Separator:** Comma (`,`).
-        - **Encoding:** UTF-8.
-        - **No index column:** Do not include an additional numeric index column.
-        - **Notes:** 
-          - All fields are mandatory.
-          - IDs must be unique and must not already exist in the current inventory.
-          - Quantity must be greater than or equal to 1.
-          - If the file contains the optional column `Estimated Demand`, it must be a number with up to 2 decimals; otherwise, it will be set to 0.0.
-        """)
+        mode = st.radio("Restock mode", ["Add stock to existing products", "Add new products"], horizontal=True)
+        if mode == "Add stock to existing products":
+            st.markdown("""
+            **Instructions for the CSV file:**
+            - **Required columns:** `ID`, `Quantity`. Optional column: `Price`.
+            - **Column format:**
+              - `ID`: Identifier of a product that is already in the inventory (text).
+              - `Quantity`: Quantity to add to the current stock (integer; negative to correct a count).
+              - `Price`: New unit price of the product (number with up to 2 decimals); leave it empty to keep the current price.
+            - **Separator:** Comma (`,`).
+            - **Encoding:** UTF-8.
+            - **Notes:**
+              - An ID may appear in several rows; its quantities are added up and the last price given is used.
+              - The update is rejected if any stock would become negative.
+              - Invalid rows are listed by line number; nothing is updated until every row is valid.
+            """)
+        else:
+            st.markdown("""
+            **Instructions for the CSV file:**
+            - **Required columns (in this order):** `ID`, `Product`, `Category`, `Quantity`, `Price`, `Supplier`, `Last Update`.
+            - **Column format:**
+              - `ID`: Unique identifier of the product (text, maximum 10 characters).
+              - `Product`: Name of the product (text).
+              - `Category`: Category of the product (text).
+              - `Quantity`: Quantity to add to inventory (integer ≥ 1).
+              - `Price`: Unit price of the product (number with up to 2 decimals).
+              - `Supplier`: Name of the supplier (text).
+              - `Last Update`: Date and time of the last update (format `YYYY-MM-DD HH:MM:SS`).
+            - **Separator:** Comma (`,`).
+            - **Encoding:** UTF-8.
+            - **No index column:** Do not include an additional numeric index column.
+            - **Notes:** 
+              - All fields are mandatory.
+              - IDs must be unique and must not already exist in the current inventory.
+              - Quantity must be greater than or equal to 1.
+              - If the file contains the optional column `Estimated Demand`, it must be a number with up to 2 decimals; otherwise, it will be set to 0.0.
+              - Invalid rows are listed by line number; nothing is loaded until every row is valid.
+            """)
 
         uploaded_file = st.file_uploader("Select a CSV file", type=["csv"])
         if uploaded_file is not None:
+            update = mode == "Add stock to existing products"
             try:
-                new_products = pd.read_csv(uploaded_file)
-                required_columns = ["ID", "Product", "Category", "Quantity", "Price", "Supplier", "Last Update"]
-                
-                if not all(col in new_products.columns for col in required_columns):
-                    st.error(f"The CSV must contain all required columns: {', '.join(required_columns)}.")
+                try:
+                    staged = staged_upload(uploaded_file, "stock update" if update else "new products")
+                except ValueError as e:
+                    st.error(str(e))
                 else:
-                    try:
-                        new_products["Quantity"] = new_products["Quantity"].astype(int)
-                        new_products["Price"] = new_products["Price"].astype(float)
-                        pd.to_datetime(new_products["Last Update"], format="%Y-%m-%d %H:%M:%S")
-                    except ValueError as e:
-                        st.error(f"Error in data: {str(e)}. Verify that 'Quantity' is an integer, 'Price' is a number, and 'Last Update' is in format `YYYY-MM-DD HH:MM:SS`.")
-                    else:
-                        if new_products["ID"].duplicated().any():
-                            st.error("The CSV contains duplicate IDs. Each ID must be unique.")
-                        elif new_products["ID"].isin(inventory["ID"]).any():
-                            st.error("Some IDs in the CSV already exist in the inventory. Use unique IDs for new products.")
-                        elif new_products["Quantity"].lt(1).any():
-                            st.error("The 'Quantity' column must be greater than or equal to 1 to restock.")
-                        elif new_products["Price"].lt(0).any():
-                            st.error("The 'Price' column cannot contain negative values.")
+                    title = "Preview of stock changes" if update else "Preview of products to add"
+                    if show_staged_upload(staged, title) and st.button("Confirm Restocking"):
+                        try:
+                            if update:
+                                commit_stock_upload(staged, st.session_state.user)
+                            else:
+                                commit_inventory_upload(staged, st.session_state.user, restock=True)
+                        except (ValueError, ProductNotFound) as e:
+                            st.error(f"Restocking failed, nothing was changed: {e}")
                         else:
-                            new_products["Price"] = new_products["Price"].round(2)
-                            if "Estimated Demand" not in new_products.columns:
-                                new_products["Estimated Demand"] = 0.0
+                            st.session_state.staged_upload = None
+                            if update:
+                                st.success(f"Stock updated for {staged.rows} product(s) successfully!")
                             else:
-                                new_products["Estimated Demand"] = new_products["Estimated Demand"].fillna(0.0).round(2)
-                            
-                            st.write("Preview of products to add:")
-                            st.dataframe(new_products.style.format({"Price": "{:.2f}", "Estimated Demand": "{:.2f}"}))
-                            if st.button("Confirm Restocking"):
-                                inventory = pd.concat([inventory, new_products], ignore_index=True)
-                                save_inventory(inventory)
-                                for id_prod in new_products["ID"]:
-                                    register_change("Restock", id_prod, st.session_state.user)
-                                st.success(f"{len(new_products)} product(s) added to inventory successfully!")
-                                inventory = load_inventory()
+                                st.success(f"{staged.rows} product(s) added to inventory successfully!")
+                            inventory = load_inventory()
             except pd.errors.EmptyDataError:
                 st.error("The CSV file is empty.")
             except pd.errors.ParserError:
@@ -397,14 +337,23 @@ else:
     elif menu == "Search Product":
         st.subheader("Search Product")
         search = st.text_input("Enter ID, Name, or Supplier")
+        col1, col2 = st.columns(2)
+        with col1:
+            fuzzy = st.checkbox("Include similar spellings")
+        with col2:
+            page_size = st.selectbox("Results per page", [25, 50, 100, 500], index=1)
         if search:
-            result = inventory[
-                inventory["ID"].str.contains(search, case=False, na=False) |
-                inventory["Product"].str.contains(search, case=False, na=False) |
-                inventory["Supplier"].str.contains(search, case=False, na=False)
-            ]
-            if not result.empty:
-                st.dataframe(result.style.format({"Price": "{:.2f}", "Estimated Demand": "{:.2f}"}))
+            page = st.session_state.get("search_page", 1)
+            result, total_results = search_products(search, page, page_size, fuzzy)
+            total_pages = max((total_results + page_size - 1) // page_size, 1)
+            if page > total_pages:
+                # A new query or page size left the page out of range
+                page = st.session_state.search_page = 1
+                result, total_results = search_products(search, page, page_size, fuzzy)
+            if total_results:
+                st.number_input("Page", min_value=1, max_value=total_pages, step=1, key="search_page")
+                st.dataframe(inventory_for_display(result).style.format({"Price": "{:.2f}", "Estimated Demand": "{:.2f}"}), hide_index=True)
+                st.caption(f"{total_results} product(s) found (page {page} of {total_pages}).")
             else:
                 st.warning("No products found with that criteria.")
 
@@ -412,20 +361,21 @@ else:
     elif menu == "Edit Product":
         st.subheader("Edit Product")
         edit_id = str(st.text_input("Enter the ID of the product to edit"))
-        if edit_id and edit_id in inventory["ID"].values:
-            product = inventory[inventory["ID"] == edit_id].iloc[0]
+        if edit_id and edit_id in inventory.index:
+            product = inventory.loc[edit_id]
             with st.form(key="edit_form"):
                 name = st.text_input("Product Name", value=product["Product"])
                 category = st.text_input("Category", value=product["Category"])
-                quantity = st.number_input("Quantity", min_value=0, step=1, value=int(product["Quantity"]))
-                price = st.number_input("Unit Price", min_value=0.0, step=0.01, value=float(product["Price"]), format="%.2f")
+                quantity = st.number_input("Quantity", min_value=0, max_value=MAX_QUANTITY, step=1, value=int(product["Quantity"]))
+                price = st.number_input("Unit Price", min_value=0.0, step=0.01, value=product["Price"] / PRICE_CENTS, format="%.2f")
                 supplier = st.text_input("Supplier", value=product["Supplier"])
                 submit_edit = st.form_submit_button(label="Save Changes")
 
                 if submit_edit:
-                    inventory.loc[inventory["ID"] == edit_id, ["Product", "Category", "Quantity", "Price", "Supplier", "Last Update"]] = \
-                        [name, category, quantity, round(price, 2), supplier, datetime.now().strftime("%Y-%m-%d %H:%M:%S")]
-                    save_inventory(inventory)
+                    update_product(edit_id, {
+                        "Product": name, "Category": category, "Quantity": int(quantity), "Price": round(price, 2),
+                        "Supplier": supplier, "Last Update": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    })
                     register_change("Edit", edit_id, st.session_state.user)
                     st.success(f"Product with ID '{edit_id}' updated successfully!")
                     inventory = load_inventory()
@@ -436,13 +386,12 @@ else:
     elif menu == "Delete Product":
         st.subheader("Delete Product")
         delete_id = str(st.text_input("Enter the ID of the product to delete"))
-        if delete_id and delete_id in inventory["ID"].values:
-            product = inventory[inventory["ID"] == delete_id].iloc[0]
+        if delete_id and delete_id in inventory.index:
+            product = inventory.loc[delete_id]
             st.write(f"Product to delete: {product['Product']} (Quantity: {product['Quantity']})")
             confirm = st.button("Confirm Deletion")
             if confirm:
-                inventory = inventory[inventory["ID"] != delete_id]
-                save_inventory(inventory)
+                delete_product(delete_id)
                 register_change("Delete", delete_id, st.session_state.user)
                 st.success(f"Product with ID '{delete_id}' deleted successfully!")
                 inventory = load_inventory()
@@ -455,57 +404,108 @@ else:
         if inventory.empty:
             st.warning("No data to generate a report.")
         else:
-            total_value = (inventory["Quantity"] * inventory["Price"]).sum()
-            low_stock = inventory[inventory["Quantity"] < 5]
+            # Prices are integer cents, so the total is exact
+            total_value = (inventory["Quantity"].astype("int64") * inventory["Price"]).sum() / PRICE_CENTS
+            restock = restock_list()
             st.write(f"**Total Inventory Value:** ${total_value:.2f}")
-            st.write(f"**Products with Low Stock (less than 5 units):** {len(low_stock)}")
-            if not low_stock.empty:
-                st.dataframe(low_stock.style.format({"Price": "{:.2f}", "Estimated Demand": "{:.2f}"}))
+            st.write(f"**Products to Restock (below their reorder point):** {len(restock)}")
+            if not restock.empty:
+                # Most urgent (fewest days of cover) first
+                with span("render_restock_list", rows=min(len(restock), 500)):
+                    st.dataframe(restock.head(500).style.format({"Daily Demand": "{:.2f}", "Demand Std": "{:.2f}", "Safety Stock": "{:.2f}",
+                                                                 "Reorder Point": "{:.2f}", "Days of Cover": "{:.1f}"}), hide_index=True)
+                if len(restock) > 500:
+                    st.caption(f"Showing the 500 most urgent of {len(restock)} products.")
+                st.download_button(
+                    label="Download Restock List as CSV",
+                    data=restock_csv,
+                    file_name=f"restock_{datetime.now().strftime('%Y%m%d')}.csv",
+                    mime="text/csv"
+                )
             
             fig = px.bar(inventory.groupby("Category")["Quantity"].sum().reset_index(), 
                         x="Category", y="Quantity", title="Quantity by Category")
             st.plotly_chart(fig) 
 
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=letter)
-            elements = []
-            title_style = ParagraphStyle(
-                name='Title',
-                fontSize=14,
-                leading=16,
-                alignment=1,
-                spaceAfter=12
-            )
-            elements.append(Paragraph("Inventory Report", title_style))
-            data = [inventory.columns.tolist()] + inventory.values.tolist()
-            table = Table(data)
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            elements.append(table)
-            doc.build(elements)
-            st.download_button(
-                label="Download Report as PDF",
-                data=buffer.getvalue(),
-                file_name=f"report_{datetime.now().strftime('%Y%m%d')}.pdf",
-                mime="application/pdf"
-            )
-
-    # Option 9: History
+            # The PDF is rendered in the background on request and reused until the inventory changes
+            report = current_report_pdf()
+            if report is None:
+                if st.button("Generate PDF Report"):
+                    request_report_pdf()
+                    st.rerun()
+            elif not report.done():
+                st.info("The PDF report is being generated in the background.")
+                st.button("Refresh")
+            elif report.exception() is not None:
+                st.error(f"Error generating the PDF report: {report.exception()}")
+                if st.button("Try Again"):
+                    request_report_pdf()
+                    st.rerun()
+            else:
+                st.download_button(
+                    label="Download Report as PDF",
+                    data=report.result(),
+                    file_name=f"report_{datetime.now().strftime('%Y%m%d')}.pdf",
+                    mime="application/pdf"
+                )
+
+    # Option 9: Sales Dashboard
+    elif menu == "Sales Dashboard":
+        st.subheader("Sales Dashboard")
+        rollups = sales_rollups()
+        daily = rollups.frame("daily")
+        if daily.empty:
+            st.info("No sales recorded yet.")
+        else:
+            first_day, last_day = daily["Date"].min().date(), daily["Date"].max().date()
+            period = st.date_input("Period", (max(first_day, last_day - timedelta(days=29)), last_day),
+                                   min_value=first_day, max_value=last_day)
+            start, end = (period[0], period[-1]) if isinstance(period, tuple) else (period, period)
+            start, end = pd.Timestamp(start), pd.Timestamp(end)
+            daily = daily[daily["Date"].between(start, end)]
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Revenue", f"${daily['Revenue'].sum():,.2f}")
+            col2.metric("Units Sold", f"{daily['Quantity'].sum():,}")
+            col3.metric("Sales", f"{daily['Sales'].sum():,}")
+
+            with span("render_dashboard_charts"):
+                st.plotly_chart(px.line(daily, x="Date", y="Revenue", title="Revenue by Day"))
+                by_category = rollups.frame("category_daily")
+                by_category = by_category[by_category["Date"].between(start, end)]
+                st.plotly_chart(px.bar(by_category, x="Date", y="Revenue", color="Category", title="Revenue by Day and Category"))
+
+            by_product = rollups.frame("product_daily")
+            by_product = by_product[by_product["Date"].between(start, end)]
+            top_sellers = by_product.groupby("ID")[["Quantity", "Revenue"]].sum().nlargest(10, "Revenue")
+            top_sellers.insert(0, "Product", inventory["Product"].reindex(top_sellers.index).fillna("(deleted)"))
+            st.write("**Top Sellers**")
+            st.dataframe(top_sellers.reset_index().style.format({"Revenue": "{:.2f}"}), hide_index=True)
+
+    # Option 10: History
     elif menu == "History":
         st.subheader("Change History")
-        if os.path.exists(HISTORY_FILE):
-            history = pd.read_csv(HISTORY_FILE)
-            st.dataframe(history)
+        total_changes = count_changes()
+        if total_changes:
+            col1, col2 = st.columns(2)
+            with col1:
+                page_size = st.selectbox("Rows per page", [50, 100, 500, 1000])
+            with col2:
+                total_pages = (total_changes + page_size - 1) // page_size
+                page = st.number_input("Page", min_value=1, max_value=total_pages, step=1)
+            # Newest changes first: page 1 is the end of the log
+            stop = total_changes - (page - 1) * page_size
+            start = max(stop - page_size, 0)
+            history = read_changes(start, stop).iloc[::-1]
+            st.dataframe(history, hide_index=True)
+            st.caption(f"Showing {start + 1}-{stop} of {total_changes} changes (page {page} of {total_pages}).")
         else:
             st.info("No change history recorded yet.")
 
     # Note at the end
     st.markdown("---")
     st.write(f"Last update: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    if diagnostics:
+        show_diagnostics()
+
+end_run()
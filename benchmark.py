@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+# Headless benchmarks of the inventory workflows, without Streamlit:
+#
+#   python benchmark.py
+#   python benchmark.py --scales 1000x90,100000x365 --storage sqlite
+#   python benchmark.py --save-baseline
+#
+# Each scale (PRODUCTSxDAYS) runs in its own process and temporary directory
+# on data from synthetic.py, so the shared caches in core.py start cold and
+# the scales do not affect each other. Each workflow is timed REPEAT times
+# and the best time is kept; record_sale and register_change are timed per
+# call. The results are compared with the baseline stored for the same
+# storage engine, and a workflow that got more than --tolerance slower (and
+# by more than MIN_DIFFERENCE seconds) is reported as a regression, with exit
+# status 1. --save-baseline stores the results as the new baseline.
+
+DEFAULT_SCALES = "1000x90,10000x365,50000x365"
+BASELINE_FILE = "benchmark_baseline.json"
+REPEAT = 3
+TOLERANCE = 0.25
+# Differences below this many seconds are timer noise
+MIN_DIFFERENCE = 0.01
+SALES_TO_RECORD = 20
+CHANGES_TO_REGISTER = 20
+SEARCH_QUERIES = ["lamp", "P0001", "steel hammer", "supplier 00", "wirless"]
+ARIMA_PRODUCTS = 20
+
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# Mean time per call of fn over the items
+def time_per_call(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / max(len(items), 1)
+
+
+# Generate a dataset in the current directory and time each workflow on it; returns {workflow: seconds}
+def run_scale(products, days, seed=0, repeat=REPEAT):
+    import core
+    from synthetic import generate
+    from search import SearchIndex
+    from report import build_report
+    from forecasting import ArimaForecaster
+
+    inventory, sales = generate(products, days, seed)
+    core.engine().save_inventory(inventory)
+    core.engine().save_sales(sales)
+    print(f"{products}x{days}: {len(inventory)} products, {len(sales)} sales", file=sys.stderr)
+    results = {}
+
+    def load_inventory():
+        core._cache.clear()
+        core.load_inventory()
+
+    def load_sales():
+        core._cache.clear()
+        core.load_sales()
+
+    def rollups():
+        core._rollups.version = None
+        core.sales_rollups()
+
+    def replenishment():
+        core._replenishment.version = None
+        core._replenishment._stats = None
+        core.restock_list()
+
+    def search():
+        index = SearchIndex()
+        index.refresh(core.load_inventory(), core.engine().version("inventory"))
+        for query in SEARCH_QUERIES:
+            index.search(query, fuzzy=query == SEARCH_QUERIES[-1])
+
+    results["load_inventory"] = best_time(load_inventory, repeat)
+    results["load_sales"] = best_time(load_sales, repeat)
+    results["sales_rollups"] = best_time(rollups, repeat)
+    daily = core.sales_rollups().frame("product_daily")
+    results["calculate_estimated_demand"] = best_time(
+        lambda: core.calculate_estimated_demand(daily, core.load_inventory(), method="croston"), repeat)
+    arima_ids = daily["ID"].value_counts().index[:ARIMA_PRODUCTS]
+    results[f"forecast_arima_{ARIMA_PRODUCTS}"] = best_time(
+        lambda: ArimaForecaster(cache_file=None, model_dir=None).forecast(daily, arima_ids, workers=1), 1)
+    results["restock_list"] = best_time(replenishment, repeat)
+    results["search"] = best_time(search, repeat)
+    results["inventory_csv"] = best_time(lambda: core.inventory_csv(core.load_inventory()), repeat)
+    results["report_pdf"] = best_time(lambda: build_report(core.inventory_for_display(core.load_inventory())), 1)
+
+    in_stock = core.load_inventory().query("Quantity > 0").index[:SALES_TO_RECORD].tolist()
+    results["record_sale"] = time_per_call(lambda product_id: core.record_sale(product_id, 1, "benchmark"), in_stock)
+    results["register_change"] = time_per_call(
+        lambda product_id: core.register_change("Edit", product_id, "benchmark"), in_stock[:CHANGES_TO_REGISTER])
+    return results
+
+
+# Run one scale in a child process and temporary directory; returns {workflow: seconds}
+def run_isolated(scale, storage, seed, repeat):
+    directory = tempfile.mkdtemp(prefix="inventory_benchmark_")
+    env = dict(os.environ, INVENTORY_STORAGE=storage)
+    try:
+        done = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", scale, "--seed", str(seed),
+                               "--repeat", str(repeat)], cwd=directory, env=env, stdout=subprocess.PIPE, check=True,
+                              text=True)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+def parse_scale(scale):
+    products, days = scale.lower().split("x")
+    return int(products), int(days)
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(baseline, path):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# Rows of (scale, workflow, seconds, baseline seconds or None, regression?)
+def compare(results, baseline, tolerance=TOLERANCE):
+    rows = []
+    for scale, timings in results.items():
+        for workflow, seconds in timings.items():
+            before = baseline.get(scale, {}).get(workflow)
+            regression = before is not None and seconds > before * (1 + tolerance) and seconds - before > MIN_DIFFERENCE
+            rows.append((scale, workflow, seconds, before, regression))
+    return rows
+
+
+def print_report(rows):
+    print(f"{'Scale':<14}{'Workflow':<30}{'Seconds':>10}{'Baseline':>10}{'Change':>9}")
+    for scale, workflow, seconds, before, regression in rows:
+        change = f"{(seconds - before) / before:+.0%}" if before else ""
+        baseline = f"{before:.4f}" if before is not None else "-"
+        print(f"{scale:<14}{workflow:<30}{seconds:>10.4f}{baseline:>10}{change:>9}" + ("  REGRESSION" if regression else ""))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmark", description="Benchmark the inventory workflows on synthetic data")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help=f"Comma separated PRODUCTSxDAYS (default: {DEFAULT_SCALES})")
+    parser.add_argument("--storage", choices=["csv", "sqlite", "parquet"], default=os.environ.get("INVENTORY_STORAGE", "csv"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=REPEAT, help=f"Runs per workflow, the best is kept (default: {REPEAT})")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help=f"Slowdown reported as a regression (default: {TOLERANCE:.0%})")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.worker:
+        print(json.dumps(run_scale(*parse_scale(args.worker), seed=args.seed, repeat=args.repeat)))
+        return 0
+    scales = [scale.strip() for scale in args.scales.split(",") if scale.strip()]
+    for scale in scales:
+        parse_scale(scale)
+    results = {scale: run_isolated(scale, args.storage, args.seed, args.repeat) for scale in scales}
+    baselines = load_baseline(args.baseline)
+    rows = compare(results, baselines.get(args.storage, {}), args.tolerance)
+    print_report(rows)
+    if args.save_baseline:
+        baselines.setdefault(args.storage, {}).update(results)
+        save_baseline(baselines, args.baseline)
+        print(f"Baseline for {args.storage} saved to {args.baseline}.")
+        return 0
+    regressions = [row for row in rows if row[4]]
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.tolerance:.0%}.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import os
+import sys
+import argparse
+from datetime import datetime
+import pandas as pd
+import core
+import instrumentation
+from storage import migrate_csv_to_sqlite
+from report import write_report
+
+# Command line entry point for jobs that should not need the Streamlit UI,
+# e.g. from cron:
+#
+#   python cli.py forecast
+#   python cli.py forecast --method arima --workers 8
+#   python cli.py --timings forecast
+#   python cli.py import inventory_feed.csv
+#   python cli.py restock new_products.csv
+#   python cli.py restock --update deliveries.csv
+#   python cli.py report --output report.pdf
+#   python cli.py reorder --output restock.csv
+#   python cli.py generate --products 10000 --days 365
+#   python cli.py migrate --db inventory.db
+#   python cli.py migrate --to parquet --dir inventory_data
+#
+# Jobs may run while the app is in use: SQLite uses transactions, and the CSV
+# and Parquet engines lock their files across processes (see locking.py; on
+# Windows, where that is not available, use INVENTORY_STORAGE=sqlite).
+
+CLI_USER = "cli"
+
+
+def cmd_forecast(args):
+    inventory, messages, not_enough = core.run_forecast(args.periods, args.workers, args.method)
+    for message in messages:
+        print(f"Warning: {message}", file=sys.stderr)
+    if not_enough:
+        print(f"Not enough sales data for {len(not_enough)} product(s).", file=sys.stderr)
+    print(f"Estimated demand calculated for {len(inventory)} product(s).")
+    return 0
+
+
+# Print the row-level errors of a staged import; returns True if there were any
+def report_errors(staged):
+    if not staged.error_count:
+        return False
+    for row in staged.errors.itertuples(index=False):
+        print(f"Line {row.Line}, {row.Column}: {row.Error}", file=sys.stderr)
+    if staged.error_count > len(staged.errors["Line"].unique()):
+        print("... only the first errors are shown.", file=sys.stderr)
+    print(f"Error: {staged.error_count} invalid row(s); nothing was imported.", file=sys.stderr)
+    staged.discard()
+    return True
+
+
+def cmd_import(args):
+    staged = core.stage_inventory_upload(args.file)
+    if report_errors(staged):
+        return 1
+    core.commit_inventory_upload(staged, args.user)
+    print(f"Initial inventory loaded: {staged.rows} product(s).")
+    return 0
+
+
+def cmd_restock(args):
+    if args.update:
+        staged = core.stage_stock_upload(args.file)
+        if report_errors(staged):
+            return 1
+        core.commit_stock_upload(staged, args.user)
+        print(f"Stock updated for {staged.rows} product(s).")
+        return 0
+    staged = core.stage_inventory_upload(args.file, restock=True)
+    if report_errors(staged):
+        return 1
+    core.commit_inventory_upload(staged, args.user, restock=True)
+    print(f"{staged.rows} product(s) added to inventory.")
+    return 0
+
+
+def cmd_report(args):
+    output = args.output or f"report_{datetime.now().strftime('%Y%m%d')}.pdf"
+    write_report(core.inventory_for_display(core.load_inventory()), output)
+    print(f"Report written to {output}.")
+    return 0
+
+
+def cmd_reorder(args):
+    output = args.output or f"restock_{datetime.now().strftime('%Y%m%d')}.csv"
+    restock = core.restock_list()
+    restock.to_csv(output, index=False)
+    print(f"{len(restock)} product(s) to restock written to {output}.")
+    return 0
+
+
+def cmd_generate(args):
+    from synthetic import generate
+    if not args.force and (core.engine().has_inventory() or core.engine().has_sales()):
+        raise ValueError("The inventory or sales already exist; use --force to replace them.")
+    inventory, sales = generate(args.products, args.days, args.seed)
+    core.engine().save_inventory(inventory)
+    core.engine().save_sales(sales)
+    print(f"Generated {len(inventory)} products and {len(sales)} sales over {args.days} days.")
+    return 0
+
+
+def cmd_migrate(args):
+    if args.to == "parquet":
+        from parquet_storage import migrate_csv_to_parquet
+        counts = migrate_csv_to_parquet(core.INVENTORY_FILE, core.SALES_FILE, core.HISTORY_FILE, args.dir)
+        print("Converted {} products and {} sales into {}.".format(*counts, args.dir))
+        return 0
+    counts = migrate_csv_to_sqlite(core.INVENTORY_FILE, core.SALES_FILE, core.HISTORY_FILE, args.db)
+    print("Imported {} products, {} sales and {} history entries into {}.".format(*counts, args.db))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="inventory", description="Inventory System command line")
+    parser.add_argument("--timings", action="store_true", help="Print the timing spans as JSON lines to stderr")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    forecast = commands.add_parser("forecast", help="Calculate estimated demand for all products")
+    forecast.add_argument("--workers", type=int, default=None, help="Worker processes for ARIMA (default: CPU count)")
+    forecast.add_argument("--method", choices=list(core.FORECASTERS), default=None,
+                          help="Forecasting method (default: INVENTORY_FORECASTER or croston)")
+    forecast.add_argument("--periods", type=int, default=30, help="Days to forecast (default: 30)")
+    forecast.set_defaults(func=cmd_forecast)
+
+    load = commands.add_parser("import", help="Replace the inventory with a CSV file")
+    load.add_argument("file")
+    load.add_argument("--user", default=CLI_USER)
+    load.set_defaults(func=cmd_import)
+
+    restock = commands.add_parser("restock", help="Add new products (or stock, with --update) from a CSV file")
+    restock.add_argument("file")
+    restock.add_argument("--user", default=CLI_USER)
+    restock.add_argument("--update", action="store_true",
+                         help="Add quantities (ID, Quantity, optional Price) to existing products instead")
+    restock.set_defaults(func=cmd_restock)
+
+    report = commands.add_parser("report", help="Write the inventory report as PDF")
+    report.add_argument("--output", default=None)
+    report.set_defaults(func=cmd_report)
+
+    reorder = commands.add_parser("reorder", help="Write the products below their reorder point as CSV, most urgent first")
+    reorder.add_argument("--output", default=None, help="Output file (default: restock_YYYYMMDD.csv)")
+    reorder.set_defaults(func=cmd_reorder)
+
+    generate = commands.add_parser("generate", help="Replace the inventory and sales with synthetic data")
+    generate.add_argument("--products", type=int, default=1000)
+    generate.add_argument("--days", type=int, default=365)
+    generate.add_argument("--seed", type=int, default=0)
+    generate.add_argument("--force", action="store_true", help="Replace existing inventory and sales")
+    generate.set_defaults(func=cmd_generate)
+
+    migrate = commands.add_parser("migrate", help="Import the CSV files into a SQLite database or Parquet files")
+    migrate.add_argument("--to", choices=["sqlite", "parquet"], default="sqlite")
+    migrate.add_argument("--db", default=os.environ.get("INVENTORY_DB", "inventory.db"))
+    migrate.add_argument("--dir", default=os.environ.get("INVENTORY_PARQUET_DIR", "inventory_data"),
+                         help="Parquet directory (with --to parquet)")
+    migrate.set_defaults(func=cmd_migrate)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # The command is timed as one run (see instrumentation.py)
+    instrumentation.begin_run(page=f"cli {args.command}", user=getattr(args, "user", CLI_USER))
+    status = "error"
+    try:
+        code = args.func(args)
+        status = "ok" if code == 0 else "failed"
+        return code
+    except (ValueError, core.ProductNotFound, pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        instrumentation.end_run(status)
+        instrumentation.write_metrics(force=True)
+        if args.timings:
+            sys.stderr.write(instrumentation.RECORDER.json_lines())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
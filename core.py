@@ -0,0 +1,348 @@
+import io
+import os
+import json
+import threading
+import pandas as pd
+from datetime import datetime, timedelta
+from storage import get_engine, ProductNotFound, InsufficientStock, MAX_QUANTITY
+from search import SearchIndex
+from importer import stage_import, stage_stock_update
+from report import ReportBuilder
+from rollups import SalesRollups
+from replenishment import Replenishment
+from forecasting import forecast_demand, get_forecaster, FORECASTERS, DEFAULT_FORECASTER
+from instrumentation import span
+
+# Inventory, sales and forecasting logic shared by the Streamlit app (app.py)
+# and the command line (cli.py). Nothing here imports Streamlit, and the heavy
+# statsmodels/reportlab imports happen only inside the functions that use them.
+
+# Files
+INVENTORY_FILE = "inventory.csv"
+HISTORY_FILE = "change_history.csv"
+SALES_FILE = "sales.csv"
+FORECAST_STATUS_FILE = "forecast_status.json"
+
+# Prices are held as integer cents in memory
+PRICE_CENTS = 100
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Rows written per chunk when exporting CSV
+EXPORT_CHUNK_ROWS = 50000
+
+# Demo data for generic inventory
+DEMO_DATA = pd.DataFrame({
+    "ID": ["001", "002", "003", "004", "005"],
+    "Product": ["Laptop", "T-shirt", "1kg Rice", "Chair", "LED Bulb"],
+    "Category": ["Electronics", "Clothing", "Food", "Furniture", "Lighting"],
+    "Quantity": [10, 20, 50, 15, 30],
+    "Price": [1200.00, 15.50, 2.80, 45.00, 3.75],
+    "Supplier": ["Dell", "Zara", "Local", "Ikea", "Philips"],
+    "Last Update": ["2025-03-02 10:00:00", "2025-03-01 15:30:00", "2025-02-28 09:15:00", 
+                    "2025-03-01 12:00:00", "2025-03-02 14:20:00"],
+    "Estimated Demand": [0.0, 0.0, 0.0, 0.0, 0.0]
+})
+
+# Demo data for historical sales (30 days)
+start_date = datetime(2025, 2, 1)
+DEMO_SALES = []
+for i in range(30):
+    date = start_date + timedelta(days=i)
+    DEMO_SALES.extend([
+        {"Date": date.strftime("%Y-%m-%d 09:00:00"), "ID": "001", "Product": "Laptop", "Quantity Sold": 1, "Unit Price": 1200.00, "Total": 1200.00, "User": "admin"},
+        {"Date": date.strftime("%Y-%m-%d 10:00:00"), "ID": "002", "Product": "T-shirt", "Quantity Sold": 3, "Unit Price": 15.50, "Total": 46.50, "User": "admin"},
+        {"Date": date.strftime("%Y-%m-%d 11:00:00"), "ID": "003", "Product": "1kg Rice", "Quantity Sold": 5, "Unit Price": 2.80, "Total": 14.00, "User": "admin"},
+        {"Date": date.strftime("%Y-%m-%d 12:00:00"), "ID": "004", "Product": "Chair", "Quantity Sold": 2, "Unit Price": 45.00, "Total": 90.00, "User": "admin"},
+        {"Date": date.strftime("%Y-%m-%d 13:00:00"), "ID": "005", "Product": "LED Bulb", "Quantity Sold": 4, "Unit Price": 3.75, "Total": 15.00, "User": "admin"}
+    ])
+DEMO_SALES = pd.DataFrame(DEMO_SALES)
+
+# Storage engine (CSV files or SQLite, see storage.py)
+def engine():
+    return get_engine(INVENTORY_FILE, SALES_FILE, HISTORY_FILE)
+
+# Parsed datasets shared by all sessions and reruns, keyed on the storage version.
+# Callers get shallow copies: with copy-on-write (always on from pandas 3) the
+# data is shared, and a column is only copied when a caller modifies it, so
+# the shared frame is never changed and sessions do not each hold a copy.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Return a dataset, re-reading it only when its storage version changed
+def cached_load(dataset, loader):
+    key = (id(engine()), dataset)
+    version = engine().version(dataset)
+    with _cache_lock:
+        entry = _cache.get(key)
+    if entry is None or entry[0] != version:
+        entry = (version, loader())
+        with _cache_lock:
+            _cache[key] = entry
+    return entry[1].copy(deep=False)
+
+# Inventory frames are indexed by product ID (the ID column is kept) for O(1) lookups
+def index_by_id(df):
+    df.index = pd.Index(df["ID"].astype(str), name=None)
+    return df
+
+# In-memory inventory model: Category and Supplier are categoricals, Quantity is
+# int32, Price is integer cents and Last Update is a datetime. It is converted
+# back to dollars and text only for display (inventory_for_display) and storage.
+def _read_inventory():
+    with span("parse_inventory"):
+        df = index_by_id(engine().load_inventory())
+    if "Estimated Demand" not in df.columns:
+        df["Estimated Demand"] = 0.0
+    df["Category"] = df["Category"].astype("category")
+    df["Supplier"] = df["Supplier"].astype("category")
+    # Checked first: astype would silently wrap quantities outside the int32 range
+    out_of_range = (df["Quantity"] < 0) | (df["Quantity"] > MAX_QUANTITY)
+    if out_of_range.any():
+        raise ValueError(f"Quantity must be between 0 and {MAX_QUANTITY}; it is not for product(s): "
+                         f"{', '.join(df['ID'][out_of_range].astype(str).head(10))}.")
+    df["Quantity"] = df["Quantity"].astype("int32")
+    df["Price"] = (df["Price"] * PRICE_CENTS).round().astype("int64")
+    df["Last Update"] = pd.to_datetime(df["Last Update"], format="ISO8601")
+    df["Estimated Demand"] = df["Estimated Demand"].fillna(0.0).round(2)
+    return df
+
+# Inventory rows as users see them: Price in dollars and Last Update as text
+def inventory_for_display(df):
+    df = df.copy(deep=False)
+    df["Price"] = df["Price"] / PRICE_CENTS
+    df["Last Update"] = df["Last Update"].dt.strftime(DATE_FORMAT)
+    return df
+
+def _read_sales():
+    with span("parse_sales"):
+        df = engine().load_sales()
+    df["Date"] = pd.to_datetime(df["Date"], format="ISO8601")
+    df["Unit Price"] = df["Unit Price"].round(2)
+    df["Total"] = df["Total"].round(2)
+    return df
+
+# Function to load inventory
+def load_inventory():
+    if not engine().has_inventory():
+        engine().save_inventory(DEMO_DATA)
+    with span("load_inventory"):
+        return cached_load("inventory", _read_inventory)
+
+# Function to load sales (Date is parsed to datetime64)
+def load_sales():
+    if not engine().has_sales():
+        engine().save_sales(DEMO_SALES)
+    with span("load_sales"):
+        return cached_load("sales", _read_sales)
+
+# Rollups of the sales (see rollups.py), shared by all sessions and updated on each sale
+_rollups = SalesRollups()
+# Serializes sale writes with the rollup update that follows them
+_sales_lock = threading.Lock()
+
+# Register a sale: stock decrement, sale row and history entry in one transaction
+def record_sale(product_id, quantity, user):
+    with _sales_lock, span("record_sale"):
+        before = _plan_version()
+        sale = engine().record_sale(product_id, quantity, user)
+        after = _plan_version()
+        day = pd.Timestamp(sale["Date"]).normalize()
+        # Units of the product already sold that day, before this sale is added to the rollups
+        sold_before = _rollups.get("product_daily", (day, str(product_id)))["Quantity"]
+        _rollups.add(pd.DataFrame([sale]), before[1], after[1])
+        _replenishment.sale(str(product_id), quantity, day, sold_before, before, after)
+    return sale
+
+# The sales rollups, rebuilt from the full history only if sales changed other than through record_sale
+def sales_rollups():
+    version = engine().version("sales")
+    if _rollups.version != version:
+        if engine().pushdown:
+            # Only read the columns the rollups need
+            sales = engine().load_sales(columns=["Date", "ID", "Quantity Sold", "Total"])
+        else:
+            sales = load_sales()
+        categories = load_inventory()["Category"]
+        with span("rebuild_rollups"):
+            _rollups.rebuild(sales, categories, version)
+    return _rollups
+
+# Reorder points and restock list (see replenishment.py), shared by all sessions and updated on each sale
+_replenishment = Replenishment()
+
+def _plan_version():
+    return engine().version("inventory"), engine().version("sales")
+
+# The replenishment plan, recomputed only if the inventory or sales changed other than through record_sale
+def replenishment():
+    version = _plan_version()
+    if _replenishment.version != version:
+        with span("refresh_replenishment"):
+            _replenishment.refresh(load_inventory(), lambda: sales_rollups().frame("product_daily"), version)
+    return _replenishment
+
+# Reorder status (see replenishment.py) of the given product IDs
+def reorder_status(product_ids):
+    return replenishment().rows(product_ids)["Status"]
+
+# Products below their reorder point, most urgent first
+def restock_list():
+    return replenishment().restock_list()
+
+# The restock list as CSV bytes
+def restock_csv():
+    return restock_list().to_csv(index=False).encode("utf-8")
+
+# Sales recorded on one day (a date or datetime), oldest first
+def sales_on(day):
+    start = pd.Timestamp(day).normalize()
+    end = start + pd.Timedelta(days=1)
+    if engine().pushdown:
+        sales = engine().load_sales(start=start, end=end)
+        sales["Date"] = pd.to_datetime(sales["Date"], format="ISO8601")
+        return sales
+    # The rollups keep the latest day's sales, updated on each sale, so today needs no reload
+    sales = sales_rollups().sales_on(start)
+    if sales is not None:
+        return sales
+    sales = load_sales()
+    if sales["Date"].is_monotonic_increasing:
+        # Sales are appended in time order, so the day is one contiguous slice
+        first, last = sales["Date"].searchsorted([start, end])
+        return sales.iloc[first:last].copy()
+    return sales[(sales["Date"] >= start) & (sales["Date"] < end)].copy()
+
+# Function to update fields of one product
+def update_product(product_id, values):
+    engine().update_product(product_id, values)
+
+# Function to delete one product
+def delete_product(product_id):
+    engine().delete_product(product_id)
+
+# Register changes in history
+def register_change(action, product_id, user):
+    register_changes(action, [product_id], user)
+
+# Register one action over many products with a single append
+def register_changes(action, product_ids, user):
+    with span("register_changes"):
+        engine().register_changes(action, product_ids, user)
+
+# Search index shared by all sessions; refreshed incrementally when the inventory changes
+_search_index = SearchIndex()
+
+# Search ID, name and supplier; returns (matching products for the page, total matches)
+def search_products(query, page=1, page_size=50, fuzzy=False):
+    # Read the version first: if a write lands in between, the next search refreshes again
+    version = engine().version("inventory")
+    inventory = load_inventory()
+    with span("refresh_search_index"):
+        _search_index.refresh(inventory, version)
+    with span("search", fuzzy=fuzzy):
+        ids, total = _search_index.search(query, (page - 1) * page_size, page_size, fuzzy)
+    return inventory.loc[ids], total
+
+# Inventory rows as CSV bytes, converted for display in chunks so only one chunk is copied at a time
+def inventory_csv(df, chunk_rows=EXPORT_CHUNK_ROWS):
+    buffer = io.BytesIO()
+    text = io.TextIOWrapper(buffer, encoding="utf-8", newline="", write_through=True)
+    with span("inventory_csv", rows=len(df)):
+        for start in range(0, max(len(df), 1), chunk_rows):
+            inventory_for_display(df.iloc[start:start + chunk_rows]).to_csv(text, header=start == 0, index=False)
+    text.detach()
+    return buffer.getvalue()
+
+# Number of entries in the change history
+def count_changes():
+    return engine().count_changes()
+
+# History entries [start, stop) in the order they were recorded
+def read_changes(start, stop):
+    return engine().read_changes(start, stop)
+
+# Function to calculate estimated demand (see forecasting.py) from the
+# per product and day sales rollup (Date, ID, Quantity, Sales).
+# Returns the inventory plus the fit warnings and the IDs without enough data.
+def calculate_estimated_demand(daily_sales, inventory, forecast_periods=30, workers=None, method=None):
+    method = method or forecast_method()
+    with span("calculate_estimated_demand", method=method, products=len(inventory)):
+        demand, messages, not_enough = forecast_demand(daily_sales, inventory["ID"].unique(), forecast_periods, workers=workers,
+                                                       method=method)
+        # Models and cached forecasts of deleted products are not needed any more
+        get_forecaster(method).prune(inventory["ID"].unique())
+    inventory["Estimated Demand"] = inventory["ID"].astype(str).map(demand).fillna(0.0)
+    return inventory, messages, not_enough
+
+# Forecasting method used when none is given, selected by INVENTORY_FORECASTER
+def forecast_method():
+    return os.environ.get("INVENTORY_FORECASTER", DEFAULT_FORECASTER)
+
+# Forecast all products, save the result and record when it ran
+def run_forecast(forecast_periods=30, workers=None, method=None):
+    method = method or forecast_method()
+    inventory, messages, not_enough = calculate_estimated_demand(sales_rollups().frame("product_daily"), load_inventory(),
+                                                                forecast_periods, workers, method)
+    # Only Estimated Demand is written: sales and edits made while the forecast ran are kept
+    with span("save_demand"):
+        engine().save_demand(inventory["Estimated Demand"].round(2))
+    status = {"Finished": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "Method": method, "Products": len(inventory),
+              "Warnings": len(messages), "Not Enough Data": len(not_enough)}
+    tmp = FORECAST_STATUS_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(status, f)
+    os.replace(tmp, FORECAST_STATUS_FILE)
+    return inventory, messages, not_enough
+
+# Status of the last forecast run, or None if it never ran
+def forecast_status():
+    if not os.path.exists(FORECAST_STATUS_FILE):
+        return None
+    with open(FORECAST_STATUS_FILE) as f:
+        return json.load(f)
+
+# Validate an uploaded inventory CSV in chunks into a staging file (see importer.py).
+# With restock=True the file must only contain products that are not in the inventory yet.
+def stage_inventory_upload(source, restock=False):
+    existing_ids = load_inventory().index if restock else None
+    return stage_import(source, restock=restock, existing_ids=existing_ids)
+
+# Commit a staged upload that has no errors: replace the inventory, or add the products for a restock
+def commit_inventory_upload(staged, user, restock=False):
+    if staged.error_count:
+        raise ValueError(f"The CSV has {staged.error_count} invalid row(s). Fix them and upload it again.")
+    if restock:
+        engine().append_inventory_chunks(staged.chunks())
+        for chunk in staged.chunks():
+            register_changes("Restock", chunk["ID"].tolist(), user)
+    else:
+        engine().save_inventory_chunks(staged.chunks())
+        register_change("Load Initial Inventory", "All", user)
+    staged.discard()
+
+# Validate a stock update feed (ID, Quantity to add, optional Price) for existing products
+def stage_stock_upload(source):
+    return stage_stock_update(source, load_inventory().index)
+
+# Apply a staged stock update in one transaction, with one history row per product
+def commit_stock_upload(staged, user):
+    if staged.error_count:
+        raise ValueError(f"The CSV has {staged.error_count} invalid row(s). Fix them and upload it again.")
+    # A feed with only a header changes nothing
+    if staged.rows:
+        engine().apply_stock_update(pd.concat(staged.chunks(), ignore_index=True), "Restock", user)
+    staged.discard()
+
+# PDF report rendered in the background, once per inventory version (see report.py)
+_report_builder = ReportBuilder()
+
+# Start rendering the report of the current inventory; returns a future with the PDF bytes
+def request_report_pdf():
+    version = engine().version("inventory")
+    return _report_builder.request(inventory_for_display(load_inventory()), version)
+
+# Future of the report for the current inventory, or None if it was not requested since the last change
+def current_report_pdf():
+    return _report_builder.current(engine().version("inventory"))
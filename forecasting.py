@@ -0,0 +1,362 @@
+import os
+import pickle
+import urllib.parse
+import hashlib
+import warnings
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from instrumentation import span, record
+
+# Demand forecasting engine.
+#
+# Forecasters are pluggable (FORECASTERS, chosen by name). The default ones
+# are vectorized: the per product and day sales rollup (see rollups.py) is
+# laid out as one day x product matrix over the last HISTORY_DAYS days, and
+# Croston's method (for intermittent demand), simple exponential smoothing
+# or a moving average run over all products at once, one NumPy step per day.
+# They need a single sale to forecast, so sparse products get a demand too.
+#
+# ARIMA is kept as the slow path. Its per product daily series are fitted
+# across a process pool, and each product's forecast is
+# cached together with its fitted parameters, keyed by a hash of its daily
+# series, so only products with new sales are refitted on the next run.
+#
+# Fitted ARIMA models are also persisted per product (MODEL_DIR), as their
+# parameters plus the final predicted state and its covariance, which is all
+# that is needed to continue the Kalman filter. When a product's history only
+# gained new days, its model is brought up to date the way the statsmodels
+# state-space extend() does it: just the new observations are filtered with
+# the existing parameters, starting from the stored state. The last day is treated as still open (sales
+# may keep arriving), so it is applied on top of the stored state for each
+# forecast but never saved into it. A full refit happens every REFIT_DAYS new
+# days, when the earlier history changed, or when the one-step errors on the
+# new days drift above DRIFT_FACTOR times the model's residual scale. A model
+# is only rewritten when it changed, and models (and cached forecasts) of
+# products no longer in the inventory are removed by prune().
+
+FORECAST_CACHE_FILE = "forecast_cache.pkl"
+MODEL_DIR = "forecast_models"
+ARIMA_ORDER = (1, 1, 1)
+MIN_SALES = 10
+# Below this many fits the process pool costs more than it saves
+MIN_PARALLEL_FITS = 8
+REFIT_DAYS = 30
+DRIFT_FACTOR = 2.0
+# Vectorized forecasters
+HISTORY_DAYS = 365
+SMOOTHING = 0.1
+MOVING_AVERAGE_DAYS = 28
+
+
+# Turn the per product and day sales rollup (Date, ID, Quantity, Sales) into
+# {ID: (first day, daily quantities)} plus the number of sales per ID
+def daily_series(daily):
+    if daily.empty:
+        return {}, {}
+    ids = daily["ID"].astype(str)
+    counts = daily["Sales"].groupby(ids).sum().to_dict()
+    quantities = daily["Quantity"].groupby([ids, pd.to_datetime(daily["Date"]).dt.normalize()]).sum()
+    series = {}
+    for product_id, values in quantities.groupby(level=0):
+        values = values.droplevel(0)
+        values = values.reindex(pd.date_range(values.index.min(), values.index.max(), freq="D"), fill_value=0)
+        series[product_id] = (values.index[0], values.to_numpy(dtype=float))
+    return series, counts
+
+
+def series_key(start, values, forecast_periods):
+    digest = hashlib.sha1(values.tobytes())
+    digest.update(f"{start:%Y-%m-%d}|{ARIMA_ORDER}|{forecast_periods}".encode())
+    return digest.hexdigest()
+
+
+def prefix_key(values):
+    return hashlib.sha1(values.tobytes()).hexdigest()
+
+
+def model_file(model_dir, product_id):
+    return os.path.join(model_dir, urllib.parse.quote(product_id, safe="") + ".pkl")
+
+
+def load_model_state(path):
+    if path and os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+    return None
+
+
+def save_model_state(state, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _fit_full(series):
+    from statsmodels.tsa.arima.model import ARIMA
+    return ARIMA(series, order=ARIMA_ORDER).fit()
+
+
+# Filter new observations with the stored parameters, starting from the stored state (as extend() does)
+def _extend(state, series):
+    from statsmodels.tsa.arima.model import ARIMA
+    model = ARIMA(series, order=ARIMA_ORDER)
+    model.ssm.initialize_known(state["state"], state["state_cov"])
+    return model.filter(state["params"])
+
+
+# What is persisted of a fitted or extended model
+def _model_state(result):
+    return {"params": result.params.to_numpy(), "state": result.predicted_state[:, -1].copy(),
+            "state_cov": result.predicted_state_cov[:, :, -1].copy()}
+
+
+# Bring the stored model up to date with the closed days, or refit it from scratch.
+# Returns the stored state itself if it was already up to date.
+def _update_model(state, start, closed):
+    dates = pd.date_range(start, periods=len(closed), freq="D")
+    usable = (
+        state is not None
+        and "params" in state
+        and state["start"] == start
+        and state["order"] == ARIMA_ORDER
+        and state["length"] <= len(closed)
+        and len(closed) - state["fitted_length"] < REFIT_DAYS
+        and state["prefix"] == prefix_key(closed[:state["length"]])
+    )
+    if usable:
+        if len(closed) == state["length"]:
+            return state
+        result = _extend(state, pd.Series(closed[state["length"]:], index=dates[state["length"]:]))
+        if np.mean(np.abs(result.resid)) <= DRIFT_FACTOR * state["scale"]:
+            return dict(state, length=len(closed), prefix=prefix_key(closed), **_model_state(result))
+    result = _fit_full(pd.Series(closed, index=dates))
+    return {"start": start, "order": ARIMA_ORDER, "length": len(closed), "fitted_length": len(closed),
+            "prefix": prefix_key(closed), "scale": float(np.sqrt(result.params["sigma2"])), **_model_state(result)}
+
+
+# Forecast one product; runs in a worker process, so it only takes and returns plain data (and the fit time)
+def fit_arima(task):
+    product_id, start, values, forecast_periods, model_dir = task
+    started = time.perf_counter()
+    # statsmodels installs its own warning filters on first import, so import it before silencing warnings
+    import statsmodels.tsa.arima.model  # noqa: F401
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            if model_dir is None or len(values) < 3:
+                result = _fit_full(pd.Series(values, index=pd.date_range(start, periods=len(values), freq="D")))
+            else:
+                path = model_file(model_dir, product_id)
+                stored = load_model_state(path)
+                state = _update_model(stored, start, values[:-1])
+                if state is not stored:
+                    save_model_state(state, path)
+                last_day = pd.Timestamp(start) + pd.Timedelta(days=len(values) - 1)
+                result = _extend(state, pd.Series(values[-1:], index=pd.DatetimeIndex([last_day], freq="D")))
+            prediction = result.forecast(steps=forecast_periods)
+        return product_id, float(prediction.mean()), result.params.to_dict(), None, time.perf_counter() - started
+    except ValueError as e:
+        return product_id, None, None, f"ARIMA could not be fitted for ID {product_id}: {str(e)}.", time.perf_counter() - started
+    except Exception as e:
+        return product_id, None, None, f"Unexpected error for ID {product_id}: {str(e)}", time.perf_counter() - started
+
+
+def load_cache(cache_file):
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            return {}
+    return {}
+
+
+def save_cache(cache, cache_file):
+    if not cache_file:
+        return
+    tmp = cache_file + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cache_file)
+
+
+# Daily quantities as a day x product matrix over the last `history_days` days of the
+# rollup (Date, ID, Quantity, Sales), plus the number of sales per product.
+# Columns follow product_ids; days without sales are 0.
+def demand_matrix(daily, product_ids, history_days=HISTORY_DAYS):
+    product_ids = pd.Index(product_ids).astype(str)
+    if daily.empty:
+        return np.zeros((0, len(product_ids))), np.zeros(len(product_ids), dtype=np.int64)
+    days = pd.to_datetime(daily["Date"]).to_numpy().astype("datetime64[D]").astype(np.int64)
+    # Factorize first so only the distinct IDs are looked up
+    codes, unique_ids = pd.factorize(daily["ID"].astype(str))
+    columns = product_ids.get_indexer(unique_ids)[codes]
+    known = columns >= 0
+    counts = np.bincount(columns[known], weights=daily["Sales"].to_numpy()[known], minlength=len(product_ids)).astype(np.int64)
+    last = days.max()
+    length = min(history_days, int(last - days.min()) + 1)
+    rows = length - 1 - (last - days)
+    keep = (rows >= 0) & known
+    matrix = np.bincount(rows[keep] * len(product_ids) + columns[keep], weights=daily["Quantity"].to_numpy(dtype=float)[keep],
+                         minlength=length * len(product_ids)).reshape(length, len(product_ids))
+    return matrix, counts
+
+
+class Forecaster:
+    min_sales = 1
+
+    # Mean daily demand over the next forecast_periods days for each product ID.
+    # Returns ({ID: demand}, warnings, IDs without enough data).
+    def forecast(self, daily, product_ids, forecast_periods=30, workers=None):
+        raise NotImplementedError
+
+    # Drop anything kept for products other than product_ids (the whole inventory)
+    def prune(self, product_ids):
+        pass
+
+
+# Backends that forecast every product at once from the day x product matrix.
+# Each product's series starts at its first sale in the window.
+class MatrixForecaster(Forecaster):
+    def forecast(self, daily, product_ids, forecast_periods=30, workers=None):
+        product_ids = pd.Index(product_ids).astype(str).unique()
+        with span("forecast_matrix"):
+            matrix, counts = demand_matrix(daily, product_ids)
+        sold = matrix > 0
+        has_data = sold.any(axis=0) & (counts >= self.min_sales)
+        first = np.where(has_data, sold.argmax(axis=0), len(matrix))
+        demand = np.zeros(len(product_ids))
+        if has_data.any():
+            with span("forecast_predict", forecaster=type(self).__name__, products=int(has_data.sum())):
+                demand[has_data] = self.predict(matrix[:, has_data], first[has_data], forecast_periods)
+        demand = np.maximum(demand, 0.0)
+        return (dict(zip(product_ids[has_data], demand[has_data].tolist())), [],
+                product_ids[~has_data].tolist())
+
+    # Forecast for each column of matrix, whose series starts at row first
+    def predict(self, matrix, first, forecast_periods):
+        raise NotImplementedError
+
+
+# Mean of the last MOVING_AVERAGE_DAYS days (fewer if the product started selling later)
+class MovingAverage(MatrixForecaster):
+    def predict(self, matrix, first, forecast_periods):
+        window = min(MOVING_AVERAGE_DAYS, len(matrix))
+        active = np.minimum(window, len(matrix) - first)
+        return matrix[-window:].sum(axis=0) / active
+
+
+# Simple exponential smoothing, started from the series mean
+class ExponentialSmoothing(MatrixForecaster):
+    def predict(self, matrix, first, forecast_periods):
+        level = matrix.sum(axis=0) / (len(matrix) - first)
+        for t, values in enumerate(matrix):
+            active = t >= first
+            level = np.where(active, level + SMOOTHING * (values - level), level)
+        return level
+
+
+# Croston's method for intermittent demand: the size of the non-zero sales and the
+# interval between them are smoothed separately, only on days with sales, and the
+# forecast is size / interval with the Syntetos-Boylan bias correction
+class Croston(MatrixForecaster):
+    def predict(self, matrix, first, forecast_periods):
+        sold = matrix > 0
+        occurrences = sold.sum(axis=0)
+        size = matrix.sum(axis=0) / occurrences
+        interval = (len(matrix) - first) / occurrences
+        # Days since the last sale, counting the current one
+        since = np.ones(matrix.shape[1])
+        for t, values in enumerate(matrix):
+            update = sold[t] & (t > first)
+            size = np.where(update, size + SMOOTHING * (values - size), size)
+            interval = np.where(update, interval + SMOOTHING * (since - interval), interval)
+            since = np.where(sold[t], 1.0, since + (t >= first))
+        return (1 - SMOOTHING / 2) * size / interval
+
+
+# Per product ARIMA, fitted across a process pool with the cached forecasts and stored models
+class ArimaForecaster(Forecaster):
+    min_sales = MIN_SALES
+
+    def __init__(self, cache_file=FORECAST_CACHE_FILE, model_dir=MODEL_DIR):
+        self.cache_file = cache_file
+        self.model_dir = model_dir
+
+    def forecast(self, daily, product_ids, forecast_periods=30, workers=None):
+        series, counts = daily_series(daily)
+        cache = load_cache(self.cache_file)
+        demand, messages, not_enough = {}, [], []
+        tasks, keys = [], {}
+        for product_id in product_ids:
+            product_id = str(product_id)
+            if counts.get(product_id, 0) < self.min_sales:
+                not_enough.append(product_id)
+                continue
+            start, values = series[product_id]
+            key = series_key(start, values, forecast_periods)
+            cached = cache.get(product_id)
+            if cached is not None and cached["key"] == key:
+                demand[product_id] = cached["demand"]
+            else:
+                keys[product_id] = key
+                tasks.append((product_id, start, values, forecast_periods, self.model_dir))
+
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and len(tasks) >= MIN_PARALLEL_FITS:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(fit_arima, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+        else:
+            results = [fit_arima(task) for task in tasks]
+
+        for product_id, value, params, message, seconds in results:
+            # Fits run in worker processes, so their time is recorded here
+            record("arima_fit", seconds, product=product_id)
+            if message is not None:
+                messages.append(message)
+                continue
+            demand[product_id] = value
+            cache[product_id] = {"key": keys[product_id], "demand": value, "params": params}
+        if results:
+            save_cache(cache, self.cache_file)
+        return demand, messages, not_enough
+
+    def prune(self, product_ids):
+        keep = {str(product_id) for product_id in product_ids}
+        cache = load_cache(self.cache_file)
+        if any(product_id not in keep for product_id in cache):
+            save_cache({product_id: cached for product_id, cached in cache.items() if product_id in keep}, self.cache_file)
+        if self.model_dir and os.path.isdir(self.model_dir):
+            files = {model_file(self.model_dir, product_id) for product_id in keep}
+            for name in os.listdir(self.model_dir):
+                path = os.path.join(self.model_dir, name)
+                if path not in files:
+                    os.remove(path)
+
+
+FORECASTERS = {
+    "croston": Croston(),
+    "exponential smoothing": ExponentialSmoothing(),
+    "moving average": MovingAverage(),
+    "arima": ArimaForecaster(),
+}
+DEFAULT_FORECASTER = "croston"
+
+
+def get_forecaster(method):
+    if method not in FORECASTERS:
+        raise ValueError(f"Unknown forecasting method '{method}' (expected {', '.join(repr(m) for m in FORECASTERS)}).")
+    return FORECASTERS[method]
+
+
+# Forecast mean daily demand for each product ID with the given method.
+# Returns ({ID: demand}, warnings, IDs without enough data).
+def forecast_demand(daily, product_ids, forecast_periods=30, workers=None, method=DEFAULT_FORECASTER):
+    return get_forecaster(method).forecast(daily, product_ids, forecast_periods, workers)
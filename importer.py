@@ -0,0 +1,231 @@
+import os
+import tempfile
+import pandas as pd
+from storage import INVENTORY_COLUMNS, MAX_QUANTITY
+
+# Streaming CSV import for "Load Initial Inventory" and "Restock".
+#
+# The file is read in chunks of CHUNK_ROWS with every column as text, and each
+# chunk is type-converted and validated with vectorized column operations.
+# Rows that fail are reported individually (by CSV line number) instead of
+# rejecting the file with one message. Valid rows are written, already
+# normalized, to a staging CSV as they are validated, so memory stays bounded
+# by the chunk size plus the set of IDs seen so far. Committing then streams
+# the staging file into the storage engine chunk by chunk inside one atomic
+# replace or transaction.
+#
+# Stock updates (restocking existing products) take a feed of ID, Quantity
+# (the amount to add, negative to correct) and an optional new Price. Each
+# chunk is validated the same way and aggregated per ID with a groupby, so the
+# staging file holds one row per product however long the feed is.
+
+REQUIRED_COLUMNS = ["ID", "Product", "Category", "Quantity", "Price", "Supplier", "Last Update"]
+CHUNK_ROWS = 100000
+PREVIEW_ROWS = 100
+MAX_REPORTED_ERRORS = 1000
+STOCK_UPDATE_COLUMNS = ["ID", "Quantity"]
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+ERROR_COLUMNS = ["Line", "Column", "Error"]
+
+
+class StagedImport:
+    def __init__(self, staging_file, rows, preview, errors, error_count):
+        self.staging_file = staging_file
+        self.rows = rows
+        self.preview = preview
+        self.errors = errors
+        self.error_count = error_count
+
+    # Normalized rows of the staging file, in chunks
+    def chunks(self, chunk_rows=CHUNK_ROWS):
+        return pd.read_csv(self.staging_file, dtype={"ID": str}, chunksize=chunk_rows)
+
+    def discard(self):
+        if os.path.exists(self.staging_file):
+            os.remove(self.staging_file)
+
+
+# Convert and check one chunk; returns (valid rows, errors as Line/Column/Error rows).
+# existing_ids is a unique pd.Index; seen_ids is a set of IDs from earlier chunks, updated in place.
+def validate_chunk(chunk, first_line, restock=False, existing_ids=None, seen_ids=None):
+    lines = pd.RangeIndex(first_line, first_line + len(chunk))
+    chunk.index = lines
+    ids = chunk["ID"].str.strip()
+    quantity = pd.to_numeric(chunk["Quantity"], errors="coerce")
+    price = pd.to_numeric(chunk["Price"], errors="coerce")
+    last_update = pd.to_datetime(chunk["Last Update"], format=DATE_FORMAT, errors="coerce")
+    demand = pd.to_numeric(chunk["Estimated Demand"], errors="coerce") if "Estimated Demand" in chunk.columns else None
+    min_quantity = 1 if restock else 0
+
+    checks = [
+        ("ID", ids.eq(""), "ID is required."),
+        ("ID", ids.duplicated(keep="first") | ids.isin(seen_ids or ()),
+         "Duplicate ID. Each ID must be unique."),
+        ("Product", chunk["Product"].str.strip().eq(""), "Product is required."),
+        ("Category", chunk["Category"].str.strip().eq(""), "Category is required."),
+        ("Supplier", chunk["Supplier"].str.strip().eq(""), "Supplier is required."),
+        ("Quantity", quantity.isna() | quantity.mod(1).ne(0), "Quantity must be an integer."),
+        ("Quantity", quantity.lt(min_quantity),
+         "Quantity must be greater than or equal to 1 to restock." if restock else "Quantity cannot be negative."),
+        ("Quantity", quantity.gt(MAX_QUANTITY), f"Quantity cannot be greater than {MAX_QUANTITY}."),
+        ("Price", price.isna(), "Price must be a number."),
+        ("Price", price.lt(0), "Price cannot be negative."),
+        ("Last Update", last_update.isna(), "Last Update must be in format YYYY-MM-DD HH:MM:SS."),
+    ]
+    if existing_ids is not None:
+        checks.append(("ID", pd.Series(existing_ids.get_indexer(ids) != -1, index=lines), "ID already exists in the inventory."))
+    if demand is not None:
+        checks.append(("Estimated Demand", demand.isna() & chunk["Estimated Demand"].str.strip().ne(""),
+                       "Estimated Demand must be a number."))
+
+    errors = _errors(lines, checks)
+    invalid = lines.isin(errors["Line"])
+
+    valid = pd.DataFrame({
+        "ID": ids,
+        "Product": chunk["Product"],
+        "Category": chunk["Category"],
+        "Quantity": quantity.fillna(0).astype("int64"),
+        "Price": price.round(2),
+        "Supplier": chunk["Supplier"],
+        "Last Update": chunk["Last Update"],
+        "Estimated Demand": demand.fillna(0.0).round(2) if demand is not None else 0.0,
+    })[~invalid]
+    if seen_ids is not None:
+        seen_ids.update(ids[ids.ne("")])
+    return valid[INVENTORY_COLUMNS], errors
+
+
+# One Line/Column/Error row per failed check, in line order
+def _errors(lines, checks):
+    errors = pd.concat([
+        pd.DataFrame({"Line": lines[mask.to_numpy()], "Column": column, "Error": message})
+        for column, mask, message in checks if mask.any()
+    ] or [pd.DataFrame(columns=ERROR_COLUMNS)], ignore_index=True)
+    return errors.sort_values(["Line", "Column"], kind="stable")
+
+
+# Convert and check one chunk of a stock update feed; returns (valid rows, errors).
+# existing_ids is a unique pd.Index of the products in the inventory.
+def validate_stock_chunk(chunk, first_line, existing_ids):
+    lines = pd.RangeIndex(first_line, first_line + len(chunk))
+    chunk.index = lines
+    ids = chunk["ID"].str.strip()
+    quantity = pd.to_numeric(chunk["Quantity"], errors="coerce")
+    has_price = "Price" in chunk.columns
+    price = pd.to_numeric(chunk["Price"], errors="coerce") if has_price else pd.Series(float("nan"), index=lines)
+
+    checks = [
+        ("ID", ids.eq(""), "ID is required."),
+        ("ID", ids.ne("") & pd.Series(existing_ids.get_indexer(ids) == -1, index=lines),
+         "ID does not exist in the inventory."),
+        ("Quantity", quantity.isna() | quantity.mod(1).ne(0), "Quantity must be an integer."),
+        ("Quantity", quantity.abs().gt(MAX_QUANTITY), f"Quantity must be between -{MAX_QUANTITY} and {MAX_QUANTITY}."),
+    ]
+    if has_price:
+        checks.append(("Price", price.isna() & chunk["Price"].str.strip().ne(""), "Price must be a number."))
+        checks.append(("Price", price.lt(0), "Price cannot be negative."))
+
+    errors = _errors(lines, checks)
+    valid = pd.DataFrame({
+        "ID": ids,
+        "Quantity": quantity.fillna(0).astype("int64"),
+        "Price": price.round(2),
+        "Line": lines,
+    })[~lines.isin(errors["Line"])]
+    return valid, errors
+
+
+# Sum the quantities per ID and keep the last price given for it, and the last line that gave it
+def _aggregate(deltas):
+    return deltas.groupby("ID", sort=False).agg(Quantity=("Quantity", "sum"), Price=("Price", "last"),
+                                                Line=("Line", "max")).reset_index()
+
+
+def _read_chunks(source, chunk_rows, required_columns):
+    reader = pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+    for i, chunk in enumerate(reader):
+        if i == 0 and not all(col in chunk.columns for col in required_columns):
+            raise ValueError(f"The CSV must contain all required columns: {', '.join(required_columns)}.")
+        yield chunk
+
+
+def _staging_file():
+    fd, staging_file = tempfile.mkstemp(prefix="inventory_import_", suffix=".csv")
+    os.close(fd)
+    return staging_file
+
+
+# Keep the first PREVIEW_ROWS rows and the first MAX_REPORTED_ERRORS errors while streaming
+class _Collector:
+    def __init__(self):
+        self.preview, self.errors = [], []
+        self.preview_rows, self.error_rows, self.error_count = 0, 0, 0
+
+    def add(self, valid, errors):
+        if self.preview_rows < PREVIEW_ROWS:
+            self.preview.append(valid.head(PREVIEW_ROWS))
+            self.preview_rows += len(self.preview[-1])
+        self.error_count += errors["Line"].nunique()
+        if self.error_rows < MAX_REPORTED_ERRORS:
+            self.errors.append(errors)
+            self.error_rows += len(errors)
+
+    def staged(self, staging_file, rows, columns, preview=None):
+        if preview is None:
+            preview = pd.concat(self.preview, ignore_index=True).head(PREVIEW_ROWS) if self.preview else pd.DataFrame(columns=columns)
+        errors = pd.concat(self.errors, ignore_index=True).head(MAX_REPORTED_ERRORS) if self.errors else pd.DataFrame(columns=ERROR_COLUMNS)
+        return StagedImport(staging_file, rows, preview, errors, self.error_count)
+
+
+# Validate a CSV (path or file object) chunk by chunk into a staging file
+def stage_import(source, restock=False, existing_ids=None, chunk_rows=CHUNK_ROWS):
+    staging_file = _staging_file()
+    if existing_ids is not None:
+        existing_ids = pd.Index(existing_ids).astype(str).unique()
+    rows = 0
+    collected = _Collector()
+    seen_ids = set()
+    # CSV line numbers: line 1 is the header
+    first_line = 2
+    try:
+        with open(staging_file, "w", newline="", encoding="utf-8") as out:
+            for chunk in _read_chunks(source, chunk_rows, REQUIRED_COLUMNS):
+                valid, errors = validate_chunk(chunk, first_line, restock, existing_ids, seen_ids)
+                first_line += len(chunk)
+                valid.to_csv(out, header=out.tell() == 0, index=False)
+                rows += len(valid)
+                collected.add(valid, errors)
+            if out.tell() == 0:
+                pd.DataFrame(columns=INVENTORY_COLUMNS).to_csv(out, index=False)
+    except BaseException:
+        os.remove(staging_file)
+        raise
+    return collected.staged(staging_file, rows, INVENTORY_COLUMNS)
+
+
+# Validate a stock update feed chunk by chunk; the staging file holds one aggregated row per ID
+def stage_stock_update(source, existing_ids, chunk_rows=CHUNK_ROWS):
+    staging_file = _staging_file()
+    existing_ids = pd.Index(existing_ids).astype(str).unique()
+    collected = _Collector()
+    partial = []
+    first_line = 2
+    try:
+        for chunk in _read_chunks(source, chunk_rows, STOCK_UPDATE_COLUMNS):
+            valid, errors = validate_stock_chunk(chunk, first_line, existing_ids)
+            first_line += len(chunk)
+            collected.add(valid.drop(columns="Line"), errors)
+            partial.append(_aggregate(valid))
+        deltas = _aggregate(pd.concat(partial, ignore_index=True)) if partial else pd.DataFrame(columns=["ID", "Quantity", "Price", "Line"])
+        # Rows that are each in range can still add up past it; reported on the ID's last line
+        excess = deltas["Quantity"].abs().gt(MAX_QUANTITY)
+        if excess.any():
+            collected.add(deltas.iloc[:0], pd.DataFrame({"Line": deltas["Line"][excess], "Column": "Quantity",
+                                                         "Error": f"Total Quantity for this ID must be between -{MAX_QUANTITY} and {MAX_QUANTITY}."}))
+        deltas = deltas.drop(columns="Line")
+        deltas.to_csv(staging_file, index=False)
+    except BaseException:
+        os.remove(staging_file)
+        raise
+    return collected.staged(staging_file, len(deltas), deltas.columns, preview=deltas.head(PREVIEW_ROWS))
@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+
+# Timing spans for the hot paths (loads, parsing, forecasting, search, sales,
+# report building, page rendering).
+#
+# A run is one Streamlit rerun (or one CLI command): begin_run() starts it on
+# the current thread and spans recorded on that thread belong to it, with
+# their duration and the change in resident memory. Spans from other threads
+# (e.g. the PDF report worker) are kept as background spans. The last
+# MAX_RUNS runs and at most MAX_SPANS_PER_RUN spans per run are kept in
+# memory, while every span also feeds per-stage histograms. These are
+# exported as Prometheus text (prometheus_text(), and written to
+# INVENTORY_METRICS_FILE at most every METRICS_WRITE_INTERVAL seconds if it is
+# set, for a textfile collector) and as JSON lines (json_lines(), and logged
+# to the "inventory.timing" logger when it is enabled for INFO).
+#
+# A rerun interrupted by st.rerun() never reaches end_run(); the next
+# begin_run() with the same session key closes it as "interrupted", timed up
+# to the end of its last span.
+
+MAX_RUNS = 50
+MAX_SPANS_PER_RUN = 500
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRICS_FILE = os.environ.get("INVENTORY_METRICS_FILE")
+METRICS_WRITE_INTERVAL = 15
+MB = 1024 * 1024
+
+logger = logging.getLogger("inventory.timing")
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+# Resident memory of the process in bytes, or None where /proc is not available
+def rss():
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# Peak resident memory of the process in bytes, or None where the resource module is missing
+def peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _delta(before, after):
+    return after - before if before is not None and after is not None else None
+
+
+class Run:
+    def __init__(self, number, key, labels):
+        self.number = number
+        self.key = key
+        self.labels = labels
+        self.started = datetime.now()
+        self.status = "running"
+        self.seconds = None
+        self.spans = []
+        self.dropped = 0
+        self.rss_start = rss()
+        self.rss_end = None
+        self._start = time.perf_counter()
+        self._last = self._start
+
+
+# Histogram of durations: count, sum, max and cumulative bucket counts
+class _Histogram:
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _histogram_lines(metric, label, histograms):
+    lines = []
+    for value, histogram in sorted(histograms.items()):
+        labels = f'{label}="{_escape(value)}"'
+        for bound, count in zip(BUCKETS, histogram.buckets):
+            lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{metric}_sum{{{labels}}} {histogram.sum:.6f}")
+        lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._runs = deque(maxlen=MAX_RUNS)
+        self._open = {}
+        self._background = deque(maxlen=MAX_SPANS_PER_RUN)
+        self._spans = {}
+        self._reruns = {}
+        self._next = 1
+        self._written = 0.0
+
+    # Start a run on this thread; an unfinished run with the same key is closed as interrupted
+    def begin_run(self, key=None, **labels):
+        with self._lock:
+            previous = self._open.pop(key, None) if key is not None else None
+            if previous is not None and previous.status == "running":
+                self._finish(previous, "interrupted", previous._last)
+            run = Run(self._next, key, labels)
+            self._next += 1
+            self._runs.append(run)
+            if key is not None:
+                self._open[key] = run
+        self._local.run = run
+        return run
+
+    # Add labels (e.g. the page) to the current run
+    def label_run(self, **labels):
+        run = getattr(self._local, "run", None)
+        if run is not None:
+            run.labels.update(labels)
+
+    def end_run(self, status="ok"):
+        run = getattr(self._local, "run", None)
+        self._local.run = None
+        if run is None:
+            return None
+        with self._lock:
+            if run.status == "running":
+                self._finish(run, status, time.perf_counter())
+            if self._open.get(run.key) is run:
+                del self._open[run.key]
+        self.write_metrics()
+        return run
+
+    def _finish(self, run, status, end):
+        run.status = status
+        run.seconds = end - run._start
+        run.rss_end = rss()
+        self._reruns.setdefault(run.labels.get("page", ""), _Histogram()).add(run.seconds)
+        self._log({"run": run.number, "status": status, "seconds": round(run.seconds, 6),
+                   "rss": run.rss_end, **run.labels})
+
+    # Record a span that took `seconds`; details (e.g. a product ID) are kept with the span but not in the metrics
+    def record(self, name, seconds, rss_delta=None, **details):
+        run = getattr(self._local, "run", None)
+        record = {"span": name, "seconds": seconds, "rss_delta": rss_delta, "thread": threading.current_thread().name,
+                  "time": datetime.now().isoformat(timespec="milliseconds"), **details}
+        with self._lock:
+            self._spans.setdefault(name, _Histogram()).add(seconds)
+            if run is None:
+                self._background.append(record)
+            elif len(run.spans) < MAX_SPANS_PER_RUN:
+                run.spans.append(record)
+                run._last = time.perf_counter()
+            else:
+                run.dropped += 1
+                run._last = time.perf_counter()
+        self._log(dict(record, run=run.number if run is not None else None))
+
+    @contextmanager
+    def span(self, name, **details):
+        before = rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, _delta(before, rss()), **details)
+
+    def _log(self, record):
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(record, default=str))
+
+    # Write prometheus_text() to INVENTORY_METRICS_FILE, if set, at most every METRICS_WRITE_INTERVAL seconds
+    def write_metrics(self, force=False):
+        if not METRICS_FILE or (not force and time.time() - self._written < METRICS_WRITE_INTERVAL):
+            return
+        self._written = time.time()
+        tmp = METRICS_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, METRICS_FILE)
+
+    # Recent runs, newest first
+    def runs_frame(self):
+        with self._lock:
+            runs = list(self._runs)[::-1]
+        return pd.DataFrame([{
+            "Run": run.number, "Started": run.started.strftime("%Y-%m-%d %H:%M:%S"), "Page": run.labels.get("page", ""),
+            "User": run.labels.get("user", ""), "Status": run.status, "Seconds": run.seconds,
+            "RSS MB": run.rss_end / MB if run.rss_end is not None else None,
+            "RSS Change MB": _delta(run.rss_start, run.rss_end) / MB if _delta(run.rss_start, run.rss_end) is not None else None,
+            "Spans": len(run.spans) + run.dropped,
+        } for run in runs], columns=["Run", "Started", "Page", "User", "Status", "Seconds", "RSS MB", "RSS Change MB", "Spans"])
+
+    # Spans of one run, or the background spans if run_number is None
+    def spans_frame(self, run_number=None):
+        with self._lock:
+            if run_number is None:
+                spans = list(self._background)
+            else:
+                spans = next((list(run.spans) for run in self._runs if run.number == run_number), [])
+        df = pd.DataFrame(spans)
+        if df.empty:
+            return pd.DataFrame(columns=["span", "seconds", "rss_delta", "thread", "time"])
+        df["rss_delta"] = df["rss_delta"] / MB
+        return df.rename(columns={"rss_delta": "rss_delta_mb"})
+
+    # Count, total, mean and max seconds per span name since the process started
+    def summary_frame(self):
+        with self._lock:
+            rows = [{"Span": name, "Count": h.count, "Total Seconds": h.sum, "Mean Seconds": h.sum / h.count,
+                     "Max Seconds": h.max} for name, h in self._spans.items()]
+        return pd.DataFrame(rows, columns=["Span", "Count", "Total Seconds", "Mean Seconds", "Max Seconds"]).sort_values(
+            "Total Seconds", ascending=False, ignore_index=True)
+
+    # Recent runs and their spans, plus the background spans, as one JSON object per line
+    def json_lines(self):
+        with self._lock:
+            runs = list(self._runs)
+            background = list(self._background)
+        lines = []
+        for run in runs:
+            lines.append({"run": run.number, "started": run.started.isoformat(timespec="milliseconds"), "status": run.status,
+                          "seconds": run.seconds, "rss_start": run.rss_start, "rss_end": run.rss_end,
+                          "dropped_spans": run.dropped, **run.labels})
+            lines.extend(dict(span, run=run.number) for span in run.spans)
+        lines.extend(dict(span, run=None) for span in background)
+        return "".join(json.dumps(line, default=str) + "\n" for line in lines)
+
+    # Metrics in the Prometheus text exposition format
+    def prometheus_text(self):
+        with self._lock:
+            spans = dict(self._spans)
+            reruns = dict(self._reruns)
+        lines = ["# HELP inventory_span_seconds Time spent in instrumented stages.",
+                 "# TYPE inventory_span_seconds histogram"]
+        lines += _histogram_lines("inventory_span_seconds", "span", spans)
+        lines += ["# HELP inventory_run_seconds Time per Streamlit rerun or CLI command, by page.",
+                  "# TYPE inventory_run_seconds histogram"]
+        lines += _histogram_lines("inventory_run_seconds", "page", reruns)
+        for metric, value, help in (("inventory_resident_memory_bytes", rss(), "Resident memory of the process."),
+                                    ("inventory_peak_resident_memory_bytes", peak_rss(), "Peak resident memory of the process.")):
+            if value is not None:
+                lines += [f"# HELP {metric} {help}", f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+# Shared by the whole process
+RECORDER = Recorder()
+begin_run = RECORDER.begin_run
+label_run = RECORDER.label_run
+end_run = RECORDER.end_run
+write_metrics = RECORDER.write_metrics
+record = RECORDER.record
+span = RECORDER.span
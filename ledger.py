@@ -0,0 +1,353 @@
+import os
+import glob
+import shutil
+import atexit
+import threading
+from collections import deque
+import pandas as pd
+from locking import FileLock
+
+# Append-only ledger stored as a CSV tail file plus immutable segments.
+#
+# New rows are only ever appended to the tail (e.g. sales.csv). A single
+# writer thread drains the in-memory buffer, so appends that arrive while a
+# batch is being fsynced are written together in the next batch (group
+# commit). When the tail grows past `compact_rows` it is rotated into
+# `<path>.segments/NNNNNN.pending.csv` and converted in the background into a
+# pickled DataFrame segment, which keeps column dtypes and loads without
+# re-parsing text. A pending file is only removed once its segment exists, so
+# a crash at any point leaves every row readable exactly once. Columns in
+# `parse_dates` are read as datetimes; segments are parsed once and cached,
+# so a reload only parses the pending files and the tail.
+#
+# Writes, rotation and reads of the files hold a FileLock on `<path>.lock`
+# (see locking.py), so processes sharing the ledger (the app and cli.py jobs)
+# do not rotate the tail over each other's rows or pick the same segment.
+#
+# Rows are numbered in append order. If writing a batch fails, its range of
+# row numbers is remembered with the error, and every append whose rows fall
+# in that range raises it; a failed batch is never reported as written.
+
+SEGMENT_SUFFIX = ".pkl"
+PENDING_SUFFIX = ".pending.csv"
+# The tail keeps the byte offset of every INDEX_STRIDE-th row for paginated reads
+INDEX_STRIDE = 1024
+# Failed batches remembered for the appends waiting on them
+MAX_FAILURES = 1000
+
+
+class AppendLedger:
+    def __init__(self, path, columns, dtype=None, compact_rows=50000, parse_dates=()):
+        self.path = path
+        self.columns = list(columns)
+        self.dtype = dtype or {}
+        self.parse_dates = list(parse_dates)
+        self.compact_rows = compact_rows
+        self.segment_dir = path + ".segments"
+        self._cond = threading.Condition()
+        self._io_lock = FileLock(path + ".lock")
+        self._buffer = []
+        self._appended = 0
+        # Rows handed to the writer so far (written or failed), and the failed (first, last, error) ranges
+        self._processed = 0
+        self._failures = deque(maxlen=MAX_FAILURES)
+        self._writer = None
+        self._tail_rows = None
+        self._compacting = False
+        self._segment_cache = {}
+        self._segments_frame = None
+        self._segments_key = None
+        self._generation = 0
+        self._reset_tail_index()
+
+    # True if the ledger holds any data on disk
+    def exists(self):
+        return os.path.exists(self.path) or bool(self._entries())
+
+    # Changes whenever the ledger's content may have changed, including writes by other processes
+    def version(self):
+        with self._io_lock:
+            try:
+                stat = os.stat(self.path)
+                tail = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                tail = None
+            return self._generation, tail, tuple(self._entries().values())
+
+    # Queue rows for appending; by default block until they are fsynced
+    def append(self, rows, wait=True):
+        if isinstance(rows, pd.DataFrame):
+            rows = rows.reindex(columns=self.columns).to_dict("records")
+        if not rows:
+            return
+        with self._cond:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name=f"ledger-writer:{self.path}", daemon=True)
+                self._writer.start()
+            self._buffer.extend(rows)
+            first = self._appended
+            self._appended += len(rows)
+            self._cond.notify_all()
+            if wait:
+                self._wait_durable(first, self._appended)
+
+    # Block until everything appended so far has been written (or has failed, which its appenders see)
+    def flush(self):
+        with self._cond:
+            while self._processed < self._appended:
+                self._cond.wait()
+
+    # Wait for rows [first, last) and raise the error of a failed batch that contains any of them
+    def _wait_durable(self, first, last):
+        while self._processed < last:
+            self._cond.wait()
+        for start, stop, error in self._failures:
+            if start < last and stop > first:
+                raise error
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._buffer:
+                    self._cond.wait()
+                rows, self._buffer = self._buffer, []
+                first, last = self._processed, self._appended
+            try:
+                self._write_rows(rows)
+            except Exception as e:
+                with self._cond:
+                    self._failures.append((first, last, e))
+                    self._processed = last
+                    self._cond.notify_all()
+                continue
+            with self._cond:
+                self._processed = last
+                self._cond.notify_all()
+            if self._tail_rows >= self.compact_rows:
+                self.compact(background=True)
+
+    def _write_rows(self, rows):
+        frame = pd.DataFrame(rows, columns=self.columns)
+        with self._io_lock:
+            self._repair_tail()
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, "a", newline="", encoding="utf-8") as f:
+                frame.to_csv(f, header=new_file, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            self._tail_rows = self._count_tail_rows() if self._tail_rows is None else self._tail_rows + len(frame)
+            self._generation += 1
+
+    # Drop a partially written last line left behind by a crash
+    def _repair_tail(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b"\n":
+                return
+            f.seek(0)
+            data = f.read()
+            f.truncate(data.rfind(b"\n") + 1)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _count_tail_rows(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "rb") as f:
+            lines = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+        return max(lines - 1, 0)
+
+    # Segment number -> file, preferring the finished segment over its pending source
+    def _entries(self):
+        entries = {}
+        for name in glob.glob(os.path.join(self.segment_dir, "*" + PENDING_SUFFIX)):
+            entries[int(os.path.basename(name).split(".")[0])] = name
+        for name in glob.glob(os.path.join(self.segment_dir, "*" + SEGMENT_SUFFIX)):
+            entries[int(os.path.basename(name).split(".")[0])] = name
+        return dict(sorted(entries.items()))
+
+    def _read_csv(self, path):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return pd.DataFrame(columns=self.columns)
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            complete = f.read(1) == b"\n"
+        df = pd.read_csv(path, dtype=self.dtype)
+        if not complete and not df.empty:
+            df = df.iloc[:-1]
+        return self._parse(df)
+
+    def _parse(self, df):
+        for column in self.parse_dates:
+            if column in df.columns and not pd.api.types.is_datetime64_any_dtype(df[column]):
+                df[column] = pd.to_datetime(df[column], format="ISO8601")
+        return df
+
+    # Segments written before parse_dates was set hold text dates, parsed here once
+    def _read_segment(self, path):
+        if path not in self._segment_cache:
+            self._segment_cache[path] = self._parse(pd.read_pickle(path))
+        return self._segment_cache[path]
+
+    # Load the whole ledger: cached segments, pending files and the tail
+    def load(self):
+        self.flush()
+        with self._io_lock:
+            entries = self._entries()
+            segments = tuple(p for p in entries.values() if p.endswith(SEGMENT_SUFFIX))
+            if segments != self._segments_key:
+                self._segment_cache = {p: f for p, f in self._segment_cache.items() if p in segments}
+                frames = [self._read_segment(p) for p in segments]
+                self._segments_frame = pd.concat(frames, ignore_index=True) if frames else None
+                self._segments_key = segments
+            pending = [self._read_csv(p) for p in entries.values() if p.endswith(PENDING_SUFFIX)]
+            tail = self._read_csv(self.path)
+        # Pending files sort after every finished segment: compaction runs one at a time
+        frames = [f for f in [self._segments_frame] + pending + [tail] if f is not None and not f.empty]
+        if not frames:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(frames, ignore_index=True)[self.columns]
+
+    def _reset_tail_index(self):
+        self._scan_pos = 0
+        self._scan_rows = 0
+        self._header_seen = False
+        self._offsets = []
+
+    # Extend the sparse row-offset index over bytes appended since the last scan
+    def _scan_tail(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < self._scan_pos:
+            self._reset_tail_index()
+        if size == self._scan_pos:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._scan_pos)
+            data = f.read(size - self._scan_pos)
+        pos = data.find(b"\n")
+        while pos != -1:
+            line_end = self._scan_pos + pos + 1
+            if not self._header_seen:
+                self._header_seen = True
+                self._offsets = [line_end]
+            else:
+                self._scan_rows += 1
+                if self._scan_rows % INDEX_STRIDE == 0:
+                    self._offsets.append(line_end)
+            pos = data.find(b"\n", pos + 1)
+        # Leave a partially written last line to be scanned once it is complete
+        self._scan_pos += data.rfind(b"\n") + 1
+
+    def _read_tail_range(self, start, stop):
+        k = start // INDEX_STRIDE
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[k])
+            return self._parse(pd.read_csv(f, header=None, names=self.columns, dtype=self.dtype,
+                                           skiprows=start - k * INDEX_STRIDE, nrows=stop - start))
+
+    # Row counts of the segments and pending files, in ledger order
+    def _parts(self):
+        parts = []
+        for path in self._entries().values():
+            frame = self._read_segment(path) if path.endswith(SEGMENT_SUFFIX) else self._read_csv(path)
+            parts.append((len(frame), frame))
+        return parts
+
+    # Total number of rows in the ledger
+    def count(self):
+        self.flush()
+        with self._io_lock:
+            self._scan_tail()
+            return sum(n for n, _ in self._parts()) + self._scan_rows
+
+    # Rows [start, stop) in append order, reading only the parts of the tail that are needed
+    def read_range(self, start, stop):
+        self.flush()
+        frames = []
+        with self._io_lock:
+            offset = 0
+            for n, frame in self._parts():
+                if start < offset + n and stop > offset:
+                    frames.append(frame.iloc[max(start - offset, 0):stop - offset])
+                offset += n
+            self._scan_tail()
+            tail_start, tail_stop = max(start - offset, 0), min(stop - offset, self._scan_rows)
+            if tail_start < tail_stop:
+                frames.append(self._read_tail_range(tail_start, tail_stop))
+        if not frames:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(frames, ignore_index=True)[self.columns]
+
+    # Rotate the tail into a segment; runs in a background thread by default
+    def compact(self, background=False):
+        with self._io_lock:
+            if self._compacting or not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                return
+            self._compacting = True
+            os.makedirs(self.segment_dir, exist_ok=True)
+            number = max(self._entries(), default=0) + 1
+            pending = os.path.join(self.segment_dir, f"{number:06d}{PENDING_SUFFIX}")
+            os.replace(self.path, pending)
+            self._tail_rows = 0
+            self._reset_tail_index()
+        if background:
+            threading.Thread(target=self._finish_compaction, args=(pending,), daemon=True).start()
+        else:
+            self._finish_compaction(pending)
+
+    def _finish_compaction(self, pending):
+        try:
+            frame = self._read_csv(pending)
+            segment = pending[:-len(PENDING_SUFFIX)] + SEGMENT_SUFFIX
+            tmp = segment + ".tmp"
+            frame.to_pickle(tmp)
+            with open(tmp, "rb") as f:
+                os.fsync(f.fileno())
+            with self._io_lock:
+                os.replace(tmp, segment)
+                os.remove(pending)
+                self._generation += 1
+        finally:
+            with self._io_lock:
+                self._compacting = False
+
+    # Replace the whole ledger (used for seeding and bulk rewrites, not per-row saves)
+    def replace(self, df):
+        self.flush()
+        with self._io_lock:
+            tmp = self.path + ".tmp"
+            df.reindex(columns=self.columns).to_csv(tmp, index=False)
+            with open(tmp, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            shutil.rmtree(self.segment_dir, ignore_errors=True)
+            self._segment_cache = {}
+            self._segments_frame = None
+            self._segments_key = None
+            self._tail_rows = len(df)
+            self._generation += 1
+            self._reset_tail_index()
+
+
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+
+# Shared ledger per file, so every Streamlit session and rerun uses one writer
+def open_ledger(path, columns, dtype=None, compact_rows=50000, parse_dates=()):
+    key = os.path.abspath(path)
+    with _ledgers_lock:
+        if key not in _ledgers:
+            _ledgers[key] = AppendLedger(path, columns, dtype=dtype, compact_rows=compact_rows, parse_dates=parse_dates)
+        return _ledgers[key]
+
+
+@atexit.register
+def _flush_all():
+    for ledger in list(_ledgers.values()):
+        try:
+            ledger.flush()
+        except Exception:
+            pass
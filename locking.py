@@ -0,0 +1,52 @@
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Locks shared by the threads of this process and by other processes.
+#
+# The CSV and Parquet engines are read-modify-write on plain files, and the
+# Streamlit app and cli.py jobs (e.g. from cron) may run side by side. A
+# FileLock holds an exclusive flock() on a separate `<file>.lock` file while
+# it is held, so a write in one process cannot interleave with a write in
+# another. It is re-entrant within a thread like threading.RLock: the flock
+# is taken by the outermost acquire only, since a second flock on another
+# descriptor of the same file would wait on the first. Where fcntl is not
+# available (Windows) it only locks within the process; run background jobs
+# with INVENTORY_STORAGE=sqlite there.
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                f = open(self.path, "a+b")
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                except BaseException:
+                    f.close()
+                    raise
+            except BaseException:
+                self._lock.release()
+                raise
+            self._file = f
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            # Closing the descriptor releases the flock
+            self._file.close()
+            self._file = None
+        self._lock.release()
@@ -0,0 +1,223 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from ledger import open_ledger
+from locking import FileLock
+from storage import CsvEngine, INVENTORY_COLUMNS, SALES_COLUMNS, HISTORY_COLUMNS
+
+# Parquet storage engine (INVENTORY_STORAGE=parquet; needs pyarrow).
+#
+# Inventory and sales are stored with explicit Arrow schemas instead of text:
+# Category, Supplier and User are dictionary encoded, quantities are int32,
+# prices are decimal128 fixed point, and the sale Date is a timestamp. The
+# engine gets prices as float dollars like the other engines; they are
+# rounded to the nearest cent once, when written, and read back as floats.
+# Reads are memory mapped and take column and row filters, which Arrow
+# pushes down to the row groups, so e.g. one day of sales only decodes the
+# row groups whose Date statistics overlap it.
+#
+# The inventory is one file, rewritten atomically like inventory.csv. Sales
+# are a directory of part files: each append writes a new part, and once
+# there are more than COMPACT_PARTS parts the small ones are merged into a
+# single part. The change history stays a CSV ledger. The read-modify-write
+# logic (sales, edits, restocks) is shared with CsvEngine.
+
+INVENTORY_FILE = "inventory.parquet"
+SALES_DIR = "sales"
+COMPACT_PARTS = 64
+ROW_GROUP_ROWS = 65536
+
+_category = pa.dictionary(pa.int32(), pa.string())
+INVENTORY_SCHEMA = pa.schema([
+    ("ID", pa.string()),
+    ("Product", pa.string()),
+    ("Category", _category),
+    ("Quantity", pa.int32()),
+    ("Price", pa.decimal128(12, 2)),
+    ("Supplier", _category),
+    ("Last Update", pa.string()),
+    ("Estimated Demand", pa.float64()),
+])
+SALES_SCHEMA = pa.schema([
+    ("Date", pa.timestamp("s")),
+    ("ID", pa.string()),
+    ("Product", pa.string()),
+    ("Quantity Sold", pa.int32()),
+    ("Unit Price", pa.decimal128(12, 2)),
+    ("Total", pa.decimal128(14, 2)),
+    ("User", _category),
+])
+
+
+# Decimal array with two decimals from float dollars, rounded to the nearest cent
+def _decimal(values, type):
+    values = pd.Series(values, dtype="float64")
+    cents = np.round(values.fillna(0).to_numpy() * 100).astype(np.int64)
+    # decimal128 stores little-endian 128-bit integers: low word, then the sign extension
+    words = np.empty((len(cents), 2), dtype=np.int64)
+    words[:, 0] = cents
+    words[:, 1] = np.where(cents < 0, -1, 0)
+    mask = values.isna().to_numpy()
+    validity = pa.array(~mask).buffers()[1] if mask.any() else None
+    return pa.Array.from_buffers(type, len(cents), [validity, pa.py_buffer(words.tobytes())],
+                                 null_count=int(mask.sum()))
+
+
+def to_table(df, schema):
+    arrays = []
+    for field in schema:
+        column = df[field.name] if field.name in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if pa.types.is_decimal(field.type):
+            arrays.append(_decimal(column, field.type))
+        elif pa.types.is_timestamp(field.type):
+            arrays.append(pa.array(pd.to_datetime(column, format="ISO8601").to_numpy().astype("datetime64[s]"),
+                                   type=field.type))
+        elif pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(column.astype(str), type=pa.string()).dictionary_encode().cast(field.type))
+        elif pa.types.is_string(field.type):
+            arrays.append(pa.array(column.astype(str), type=field.type))
+        else:
+            arrays.append(pa.array(column.fillna(0) if field.name == "Estimated Demand" else column, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+# Arrow table to the frame the other engines return: decimals as float, dictionaries as text
+def to_frame(table):
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        if pa.types.is_decimal(column.type):
+            column = pc.cast(column, pa.float64())
+        elif pa.types.is_dictionary(column.type):
+            column = pc.cast(column, pa.string())
+        columns.append(column)
+    return pa.Table.from_arrays(columns, names=table.column_names).to_pandas()
+
+
+def _write_atomic(table, path):
+    tmp = os.path.join(os.path.dirname(path) or ".", "." + os.path.basename(path) + ".tmp")
+    pq.write_table(table, tmp, row_group_size=ROW_GROUP_ROWS)
+    os.replace(tmp, path)
+
+
+# Sales as a directory of Parquet parts; has the interface CsvEngine uses on its sales ledger
+class ParquetLog:
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        # Other processes may append or compact too (see locking.py)
+        self._lock = FileLock(path + ".lock")
+        self._generation = 0
+
+    def _parts(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path) if name.startswith("part-") and name.endswith(".parquet"))
+
+    def _next_part(self, parts):
+        number = int(parts[-1][5:-8]) + 1 if parts else 0
+        return os.path.join(self.path, f"part-{number:09d}.parquet")
+
+    def exists(self):
+        return bool(self._parts())
+
+    def version(self):
+        return self._generation, tuple(self._parts())
+
+    # Rows as a DataFrame; columns and filters (pyarrow filter expressions) are pushed down
+    def load(self, columns=None, filters=None):
+        with self._lock:
+            parts = [os.path.join(self.path, name) for name in self._parts()]
+            if not parts:
+                return pd.DataFrame(columns=columns or self.schema.names)
+            table = pq.ParquetDataset(parts, schema=self.schema, filters=filters, memory_map=True).read(columns=columns)
+        return to_frame(table)
+
+    def append(self, rows):
+        df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+        if df.empty:
+            return
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            parts = self._parts()
+            _write_atomic(to_table(df, self.schema), self._next_part(parts))
+            self._generation += 1
+            if len(parts) + 1 > COMPACT_PARTS:
+                self._compact()
+
+    # Merge the parts smaller than a row group into one
+    def _compact(self):
+        parts = self._parts()
+        small = [name for name in parts if pq.ParquetFile(os.path.join(self.path, name)).metadata.num_rows < ROW_GROUP_ROWS]
+        if len(small) < 2:
+            return
+        paths = [os.path.join(self.path, name) for name in small]
+        table = pa.concat_tables(pq.read_table(path, schema=self.schema, memory_map=True) for path in paths)
+        # The merged part takes the last small part's name, so the order of the rows is kept
+        _write_atomic(table, paths[-1])
+        for path in paths[:-1]:
+            os.remove(path)
+        self._generation += 1
+
+    def replace(self, df):
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            parts = self._parts()
+            _write_atomic(to_table(df, self.schema), self._next_part(parts))
+            for name in parts:
+                os.remove(os.path.join(self.path, name))
+            self._generation += 1
+
+
+class ParquetEngine(CsvEngine):
+    pushdown = True
+
+    def __init__(self, directory, history_file):
+        os.makedirs(directory, exist_ok=True)
+        self.inventory_file = os.path.join(directory, INVENTORY_FILE)
+        self.sales = ParquetLog(os.path.join(directory, SALES_DIR), SALES_SCHEMA)
+        self.history = open_ledger(history_file, HISTORY_COLUMNS, dtype={"Product ID": str})
+        self._lock = FileLock(self.inventory_file + ".lock")
+        self._inventory_generation = 0
+
+    def load_inventory(self):
+        return to_frame(pq.read_table(self.inventory_file, memory_map=True))
+
+    def save_inventory(self, df):
+        with self._lock:
+            _write_atomic(to_table(df, INVENTORY_SCHEMA), self.inventory_file)
+            self._inventory_generation += 1
+
+    def _write_chunks(self, chunks, append):
+        with self._lock:
+            tmp = os.path.join(os.path.dirname(self.inventory_file), "." + INVENTORY_FILE + ".tmp")
+            with pq.ParquetWriter(tmp, INVENTORY_SCHEMA) as writer:
+                if append and self.has_inventory():
+                    writer.write_table(pq.read_table(self.inventory_file, schema=INVENTORY_SCHEMA, memory_map=True))
+                for chunk in chunks:
+                    writer.write_table(to_table(chunk.reindex(columns=INVENTORY_COLUMNS), INVENTORY_SCHEMA))
+            os.replace(tmp, self.inventory_file)
+            self._inventory_generation += 1
+
+    def load_sales(self, columns=None, start=None, end=None):
+        filters = []
+        if start is not None:
+            filters.append(("Date", ">=", pd.Timestamp(start).to_pydatetime()))
+        if end is not None:
+            filters.append(("Date", "<", pd.Timestamp(end).to_pydatetime()))
+        return self.sales.load(columns, filters or None)
+
+
+# Convert the CSV inventory and sales into a Parquet directory; the history file is shared as is
+def migrate_csv_to_parquet(inventory_file, sales_file, history_file, directory):
+    source = CsvEngine(inventory_file, sales_file, history_file)
+    target = ParquetEngine(directory, history_file)
+    if target.has_inventory() or target.has_sales():
+        raise ValueError(f"The directory '{directory}' already contains data.")
+    inventory = source.load_inventory() if source.has_inventory() else pd.DataFrame(columns=INVENTORY_COLUMNS)
+    sales = source.load_sales() if source.has_sales() else pd.DataFrame(columns=SALES_COLUMNS)
+    target.save_inventory(inventory)
+    target.save_sales(sales)
+    return len(inventory), len(sales)
@@ -0,0 +1,148 @@
+import threading
+import numpy as np
+import pandas as pd
+
+# Reorder points and restock suggestions.
+#
+# For each product the daily demand is the forecast (Estimated Demand), or
+# the mean daily sales over the last VARIABILITY_DAYS days when it has not
+# been forecast. Demand variability is the standard deviation of the daily
+# sales over the same window, which starts at the product's first sale in it.
+# With a lead time of LEAD_TIME_DAYS and a service level factor
+# SERVICE_LEVEL_Z:
+#
+#   safety stock  = SERVICE_LEVEL_Z * std * sqrt(LEAD_TIME_DAYS)
+#   reorder point = demand * LEAD_TIME_DAYS + safety stock
+#   days of cover = quantity / demand
+#
+# A product needs restocking when its quantity is below the reorder point,
+# and the suggested order brings it up to the reorder point plus
+# REVIEW_DAYS of demand. Products with no sales and no forecast keep the old
+# fixed rule (fewer than DEFAULT_REORDER_POINT units).
+#
+# Everything is computed with column operations over the whole catalog, from
+# the inventory and the per product and day sales rollup, and kept per
+# (inventory, sales) storage version. The window sums are only recomputed
+# when sales changed other than through a sale: a sale updates the sums,
+# quantity and figures of its own product.
+
+LEAD_TIME_DAYS = 7
+# About a 95% service level
+SERVICE_LEVEL_Z = 1.65
+REVIEW_DAYS = 30
+VARIABILITY_DAYS = 90
+DEFAULT_REORDER_POINT = 5
+
+OUT_OF_STOCK = "Out of stock"
+REORDER = "Reorder"
+OK = "OK"
+COLUMNS = ["ID", "Product", "Category", "Supplier", "Quantity", "Daily Demand", "Demand Std", "Safety Stock",
+           "Reorder Point", "Days of Cover", "Suggested Order", "Status"]
+
+
+# Sum and sum of squares of the daily quantities per product over the last `days` days of
+# the rollup (Date, ID, Quantity), plus the number of days since each product's first sale
+# in that window; returns (stats indexed by ID, last day)
+def window_stats(daily, days=VARIABILITY_DAYS):
+    if daily.empty:
+        return pd.DataFrame(columns=["Sum", "Squares", "Days"], dtype=float), None
+    dates = pd.to_datetime(daily["Date"]).dt.normalize()
+    end = dates.max()
+    recent = dates > end - pd.Timedelta(days=days)
+    quantity = daily["Quantity"][recent].astype(float)
+    grouped = pd.DataFrame({"Sum": quantity, "Squares": quantity ** 2, "First": dates[recent]}).groupby(
+        daily["ID"][recent].astype(str)).agg(Sum=("Sum", "sum"), Squares=("Squares", "sum"), First=("First", "min"))
+    grouped["Days"] = ((end - grouped.pop("First")).dt.days + 1).astype(float)
+    return grouped, end
+
+
+# Demand, safety stock, reorder point, days of cover, suggested order and status for rows
+# with Quantity, Estimated Demand, Sum, Squares and Days
+def plan(rows):
+    quantity = rows["Quantity"].to_numpy(dtype=float)
+    days = rows["Days"].to_numpy()
+    sold = days > 0
+    mean = np.divide(rows["Sum"].to_numpy(), days, out=np.zeros(len(rows)), where=sold)
+    variance = np.divide(rows["Squares"].to_numpy(), days, out=np.zeros(len(rows)), where=sold) - mean ** 2
+    std = np.sqrt(np.maximum(variance, 0.0))
+    forecast = rows["Estimated Demand"].to_numpy(dtype=float)
+    demand = np.where(forecast > 0, forecast, mean)
+    safety = SERVICE_LEVEL_Z * std * np.sqrt(LEAD_TIME_DAYS)
+    reorder_point = np.where((demand > 0) | (std > 0), demand * LEAD_TIME_DAYS + safety, DEFAULT_REORDER_POINT)
+    cover = np.divide(quantity, demand, out=np.where(quantity > 0, np.inf, 0.0), where=demand > 0)
+    low = quantity < reorder_point
+    order = np.where(low, np.ceil(np.maximum(reorder_point + demand * REVIEW_DAYS - quantity, 0.0)), 0.0)
+    rows["Daily Demand"] = demand.round(2)
+    rows["Demand Std"] = std.round(2)
+    rows["Safety Stock"] = safety.round(2)
+    rows["Reorder Point"] = reorder_point.round(2)
+    rows["Days of Cover"] = cover.round(1)
+    rows["Suggested Order"] = order.astype("int64")
+    rows["Status"] = np.select([quantity <= 0, low], [OUT_OF_STOCK, REORDER], OK)
+    return rows
+
+
+class Replenishment:
+    def __init__(self):
+        self.version = None
+        self._lock = threading.Lock()
+        self._sales_version = None
+        self._stats = None
+        self._end = None
+        self._rows = pd.DataFrame(columns=COLUMNS + ["Estimated Demand", "Sum", "Squares", "Days"])
+        self._restock = None
+
+    # Recompute every product for version (inventory version, sales version); load_daily returns the
+    # per product and day rollup and is only called if the sales changed since the last refresh
+    def refresh(self, inventory, load_daily, version):
+        with self._lock:
+            if version == self.version:
+                return
+            if self._stats is None or version[1] != self._sales_version:
+                self._stats, self._end = window_stats(load_daily())
+                self._sales_version = version[1]
+            rows = inventory[["ID", "Product", "Category", "Supplier", "Quantity", "Estimated Demand"]].copy()
+            rows = rows.join(self._stats).fillna({"Sum": 0.0, "Squares": 0.0, "Days": 0.0})
+            self._rows = plan(rows)
+            self._restock = None
+            self.version = version
+
+    # Apply one sale of `quantity` units on `day`, of which `sold_before` units had already been sold
+    # that day, if the plan was at version `before`; it is then at `after`.
+    # Returns False (and marks the plan stale) if it was not current or the sale starts a new day.
+    def sale(self, product_id, quantity, day, sold_before, before, after):
+        with self._lock:
+            if self.version is None or self.version != before or product_id not in self._rows.index \
+                    or self._end is None or day != self._end:
+                self.version = None
+                return False
+            row = self._rows.loc[[product_id]].copy()
+            row["Quantity"] -= quantity
+            if row["Days"].iloc[0] == 0:
+                # First sale in the window
+                row["Days"] = 1.0
+            row["Sum"] += quantity
+            row["Squares"] += (sold_before + quantity) ** 2 - sold_before ** 2
+            self._rows.loc[[product_id]] = plan(row)
+            if product_id in self._stats.index:
+                self._stats.loc[product_id, ["Sum", "Squares", "Days"]] = row[["Sum", "Squares", "Days"]].iloc[0].to_numpy()
+            else:
+                self._stats.loc[product_id] = row[["Sum", "Squares", "Days"]].iloc[0]
+            self._restock = None
+            self.version = after
+            self._sales_version = after[1]
+            return True
+
+    # The plan of the given product IDs, in that order
+    def rows(self, product_ids):
+        with self._lock:
+            return self._rows.reindex(product_ids)[COLUMNS].copy()
+
+    # Products below their reorder point, most urgent (fewest days of cover) first
+    def restock_list(self):
+        with self._lock:
+            if self._restock is None:
+                restock = self._rows[self._rows["Status"] != OK]
+                self._restock = restock.sort_values(["Days of Cover", "Suggested Order"], ascending=[True, False],
+                                                    kind="stable")[COLUMNS]
+            return self._restock.copy()
@@ -0,0 +1,102 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from instrumentation import span
+
+# Inventory report as PDF.
+#
+# The inventory is laid out as a run of tables of ROWS_PER_TABLE rows, each
+# with its own header row (repeatRows=1 also repeats it if a table breaks
+# across a page), fixed column widths and row heights, and one shared
+# TableStyle. reportlab then never measures every cell or splits one huge
+# table, so the cost grows linearly with the number of products.
+# ReportBuilder renders in a background thread and keeps the PDF of the
+# latest inventory version, so the Report page only pays for it when someone
+# asks for it, and only once per inventory change.
+
+ROWS_PER_TABLE = 36
+# Fixed row heights in points, so reportlab does not measure every cell
+HEADER_HEIGHT = 16
+ROW_HEIGHT = 12
+# Relative column widths; columns not listed get 1.0
+COLUMN_WEIGHTS = {"Product": 2.2, "Category": 1.4, "Supplier": 1.4, "Last Update": 1.9, "Estimated Demand": 1.3}
+DECIMAL_COLUMNS = ["Price", "Estimated Demand"]
+
+
+# All cells as text, formatted one column at a time
+def _cells(inventory):
+    cells = inventory.reset_index(drop=True)
+    for column in cells.columns:
+        if column in DECIMAL_COLUMNS:
+            cells[column] = cells[column].map("{:.2f}".format)
+        else:
+            cells[column] = cells[column].astype(str)
+    return cells
+
+
+# Write the report to a file name or binary file object
+def write_report(inventory, output):
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib import colors
+    from reportlab.lib.styles import ParagraphStyle
+    doc = SimpleDocTemplate(output, pagesize=landscape(letter), title="Inventory Report")
+    title_style = ParagraphStyle(
+        name='Title',
+        fontSize=14,
+        leading=16,
+        alignment=1,
+        spaceAfter=12
+    )
+    style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black)
+    ])
+    header = inventory.columns.tolist()
+    weights = [COLUMN_WEIGHTS.get(column, 1.0) for column in header]
+    widths = [doc.width * w / sum(weights) for w in weights]
+    with span("report_cells", rows=len(inventory)):
+        rows = _cells(inventory).values.tolist()
+    elements = [Paragraph("Inventory Report", title_style)]
+    for start in range(0, len(rows), ROWS_PER_TABLE):
+        chunk = rows[start:start + ROWS_PER_TABLE]
+        elements.append(Table([header] + chunk, colWidths=widths, rowHeights=[HEADER_HEIGHT] + [ROW_HEIGHT] * len(chunk),
+                              repeatRows=1, style=style))
+        elements.append(Spacer(1, 6))
+    with span("report_build", rows=len(rows)):
+        doc.build(elements)
+
+
+# Build the report as PDF bytes
+def build_report(inventory):
+    buffer = BytesIO()
+    write_report(inventory, buffer)
+    return buffer.getvalue()
+
+
+class ReportBuilder:
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report")
+        self._lock = threading.Lock()
+        self._version = None
+        self._future = None
+
+    # Future with the PDF bytes for this inventory version; renders at most once per version
+    def request(self, inventory, version):
+        with self._lock:
+            failed = self._future is not None and self._future.done() and self._future.exception() is not None
+            if self._future is None or version != self._version or failed:
+                self._version = version
+                self._future = self._executor.submit(build_report, inventory)
+            return self._future
+
+    # Future for the version last requested, if it is still the given one
+    def current(self, version):
+        with self._lock:
+            return self._future if version == self._version else None
@@ -0,0 +1,156 @@
+import threading
+import pandas as pd
+
+# Sales rollups: quantity sold, revenue and number of sales per day, per
+# product, per product and day, and per category and day.
+#
+# They are built with one groupby per rollup over the sales history and then
+# kept up to date by adding each new sale to its buckets, so daily totals,
+# the sales dashboard and the forecasting inputs read these small tables
+# instead of scanning raw sales. Like the search index, they are tagged with
+# the storage version of the sales they reflect: new sales are only folded
+# in when the rollups were current right before they were written, otherwise
+# (sales rewritten, or written by another process) they are rebuilt on the
+# next read.
+#
+# Categories are the product's category when the sale was recorded; on a
+# rebuild they come from the current inventory, and products that no longer
+# exist are counted as UNCATEGORIZED.
+#
+# The sales of the latest day are kept too (with the columns the rollups were
+# rebuilt from), so today's sales are listed without reloading the history.
+
+ROLLUPS = {
+    "daily": ["Date"],
+    "product": ["ID"],
+    "product_daily": ["Date", "ID"],
+    "category_daily": ["Date", "Category"],
+}
+VALUES = ["Quantity", "Revenue", "Sales"]
+UNCATEGORIZED = "Uncategorized"
+
+
+# One row per sale with the rollup keys and values; categories maps ID -> Category
+# and is only used when the sales carry no Category column
+def sale_rows(sales, categories=None):
+    ids = sales["ID"].astype(str)
+    if "Category" in sales.columns:
+        category = sales["Category"].astype(str)
+    else:
+        # Categories may be categorical, which would reject the UNCATEGORIZED fill
+        category = ids.map(categories).astype(object) if categories is not None else pd.Series(index=ids.index, dtype=object)
+    return pd.DataFrame({
+        "Date": pd.to_datetime(sales["Date"], format="ISO8601").dt.normalize(),
+        "ID": ids,
+        "Category": category.fillna(UNCATEGORIZED),
+        "Quantity": sales["Quantity Sold"].astype("int64"),
+        "Revenue": sales["Total"].astype(float),
+        "Sales": 1,
+    })
+
+
+def _index(keys, names):
+    if len(names) > 1:
+        return pd.MultiIndex.from_tuples(keys, names=names)
+    return pd.Index(keys, name=names[0])
+
+
+class SalesRollups:
+    def __init__(self):
+        self.version = None
+        self._lock = threading.Lock()
+        # Per rollup: a grouped frame (index = keys, columns = VALUES as float) from the last
+        # rebuild, plus the sales added since then as {key: [quantity, revenue, sales]}
+        self._base = {name: pd.DataFrame(columns=VALUES, index=_index([], keys), dtype=float) for name, keys in ROLLUPS.items()}
+        self._delta = {name: {} for name in ROLLUPS}
+        self._frames = {}
+        # Latest day with sales, its sales as frames added since the last concat, and their columns
+        self._day = None
+        self._day_sales = []
+        self._day_columns = None
+
+    # Rebuild every rollup from the full sales history
+    def rebuild(self, sales, categories, version):
+        rows = sale_rows(sales, categories)
+        base = {name: rows.groupby(keys)[VALUES].sum().astype(float) for name, keys in ROLLUPS.items()}
+        day = rows["Date"].max() if not rows.empty else None
+        latest = sales[rows["Date"] == day].copy() if day is not None else sales.iloc[:0].copy()
+        latest["Date"] = pd.to_datetime(latest["Date"], format="ISO8601")
+        with self._lock:
+            self._base = base
+            self._delta = {name: {} for name in ROLLUPS}
+            self._frames = {}
+            self._day, self._day_sales, self._day_columns = day, [latest], list(sales.columns)
+            self.version = version
+
+    # Fold new sales in if the rollups were at version `before`; they are then at `after`.
+    # Returns False (and marks the rollups stale) if they were not current.
+    # The sales carry their Category, as record_sale returns it.
+    def add(self, sales, before, after):
+        rows = sale_rows(sales)
+        with self._lock:
+            if self.version is None or self.version != before:
+                self.version = None
+                return False
+            for row in rows.itertuples(index=False):
+                values = (row.Quantity, row.Revenue, row.Sales)
+                for name, key in (("daily", row.Date), ("product", row.ID), ("product_daily", (row.Date, row.ID)),
+                                  ("category_daily", (row.Date, row.Category))):
+                    bucket = self._delta[name].setdefault(key, [0.0, 0.0, 0.0])
+                    for i, value in enumerate(values):
+                        bucket[i] += value
+                    self._frames.pop(name, None)
+            self._add_day_sales(sales, rows["Date"])
+            self.version = after
+            return True
+
+    # Keep the added sales that fall on the latest day, or start a new latest day
+    def _add_day_sales(self, sales, days):
+        day = days.max() if not days.empty else None
+        if day is None or (self._day is not None and day < self._day):
+            day = self._day
+        elif self._day is None or day > self._day:
+            self._day, self._day_sales = day, []
+        added = sales.loc[(days == day).to_numpy()].reindex(columns=self._day_columns)
+        added["Date"] = pd.to_datetime(added["Date"], format="ISO8601")
+        self._day_sales.append(added)
+
+    # Sales on `day` (a normalized Timestamp) in the order added, or None if it is
+    # before the latest day with sales, whose sales are not kept
+    def sales_on(self, day):
+        with self._lock:
+            if self.version is None or self._day_columns is None:
+                return None
+            if self._day is None or day > self._day:
+                return pd.DataFrame(columns=self._day_columns)
+            if day < self._day:
+                return None
+            if len(self._day_sales) > 1:
+                self._day_sales = [pd.concat(self._day_sales, ignore_index=True)]
+            return self._day_sales[0].copy()
+
+    # Quantity, Revenue and Sales for one key of a rollup, e.g. get("daily", day)
+    def get(self, name, key):
+        with self._lock:
+            base = self._base[name]
+            quantity, revenue, count = base.loc[key].tolist() if key in base.index else (0.0, 0.0, 0.0)
+            delta = self._delta[name].get(key, (0.0, 0.0, 0.0))
+        return {"Quantity": int(quantity + delta[0]), "Revenue": round(revenue + delta[1], 2), "Sales": int(count + delta[2])}
+
+    # A rollup as a DataFrame with its key columns plus Quantity, Revenue and Sales
+    def frame(self, name):
+        with self._lock:
+            df = self._frames.get(name)
+            if df is None:
+                delta = self._delta[name]
+                if delta:
+                    # Fold the added sales into the base
+                    added = pd.DataFrame(list(delta.values()), columns=VALUES, index=_index(list(delta), ROLLUPS[name]))
+                    self._base[name] = self._base[name].add(added, fill_value=0.0)
+                    self._delta[name] = {}
+                df = self._base[name].reset_index()
+                df = df.astype({"Quantity": "int64", "Sales": "int64"})
+                df["Revenue"] = df["Revenue"].round(2)
+                df = df.sort_values(ROLLUPS[name], ignore_index=True)
+                self._frames[name] = df
+            return df.copy()
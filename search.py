@@ -0,0 +1,173 @@
+import threading
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+# Trigram index over product ID, name and supplier for "Search Product".
+#
+# Each product is a document made of its lower-cased fields, each padded with
+# a separator so that every 1-3 character substring lies inside some trigram.
+# The bulk of the postings live in one sorted int32 array (built in a single
+# pass); products added or changed afterwards go into small per-trigram sets
+# and replaced documents are tombstoned. refresh() diffs the inventory against
+# what the index holds and only re-indexes the products that changed, so
+# edits, restocks and deletes do not rebuild the index. Once the deltas grow
+# past REBUILD_FRACTION of the base the index is rebuilt.
+
+SEARCH_FIELDS = ["ID", "Product", "Supplier"]
+SEPARATOR = "\x1f"
+REBUILD_FRACTION = 0.2
+FUZZY_THRESHOLD = 0.3
+EMPTY = np.array([], dtype=np.int32)
+
+
+def _document(fields):
+    return SEPARATOR + SEPARATOR.join(fields) + SEPARATOR
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _array(docs):
+    return np.fromiter(docs, dtype=np.int32, count=len(docs))
+
+
+class SearchIndex:
+    def __init__(self):
+        self.version = None
+        self._lock = threading.Lock()
+        self._fields = pd.DataFrame(columns=SEARCH_FIELDS[1:], dtype=object)
+        self._build({})
+
+    def _build(self, docs):
+        self._docs = []         # doc number -> lower-cased fields
+        self._product_ids = []  # doc number -> product ID
+        self._doc_of = {}       # product ID -> live doc number
+        self._id_docs = {}      # lower-cased ID -> live doc number
+        self._dead = set()
+        self._extra = defaultdict(set)
+        gram_list, doc_list = [], []
+        for product_id, fields in docs.items():
+            grams = self._register(product_id, fields)
+            gram_list.extend(grams)
+            doc_list.extend([self._doc_of[product_id]] * len(grams))
+        codes, uniques = pd.factorize(pd.Series(gram_list, dtype=object))
+        order = np.argsort(codes, kind="stable")
+        self._postings = np.asarray(doc_list, dtype=np.int32)[order]
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        self._base = {gram: (bounds[i], bounds[i + 1]) for i, gram in enumerate(uniques)}
+        self._base_size = len(self._docs)
+
+    def _register(self, product_id, fields):
+        doc = len(self._docs)
+        self._docs.append(fields)
+        self._product_ids.append(product_id)
+        self._doc_of[product_id] = doc
+        self._id_docs[fields[0]] = doc
+        return _trigrams(_document(fields))
+
+    def _add(self, product_id, fields):
+        doc = len(self._docs)
+        for gram in self._register(product_id, fields):
+            self._extra[gram].add(doc)
+
+    def _remove(self, product_id):
+        doc = self._doc_of.pop(product_id)
+        self._dead.add(doc)
+        if self._id_docs.get(self._docs[doc][0]) == doc:
+            del self._id_docs[self._docs[doc][0]]
+
+    # Bring the index in line with the inventory, re-indexing only changed products
+    def refresh(self, inventory, version=None):
+        with self._lock:
+            if version is not None and version == self.version:
+                return
+            fields = inventory[SEARCH_FIELDS[1:]].astype(str)
+            fields.index = inventory["ID"].astype(str).to_numpy()
+            old = self._fields
+            removed = old.index.difference(fields.index)
+            added = fields.index.difference(old.index)
+            common = fields.index.intersection(old.index)
+            differs = (fields.loc[common].to_numpy() != old.loc[common].to_numpy()).any(axis=1)
+            changed = common[differs]
+            if len(removed) + len(added) + len(changed) + len(self._dead) > REBUILD_FRACTION * max(self._base_size, 1):
+                self._build({product_id: (product_id.lower(),) + tuple(value.lower() for value in values)
+                             for product_id, values in zip(fields.index, fields.itertuples(index=False, name=None))})
+            else:
+                for product_id in removed.union(changed):
+                    self._remove(product_id)
+                for product_id in added.union(changed):
+                    self._add(product_id, (product_id.lower(),) + tuple(value.lower() for value in fields.loc[product_id]))
+            self._fields = fields
+            self.version = version
+
+    def _grams(self):
+        return self._base.keys() | self._extra.keys()
+
+    def _docs_with(self, gram):
+        start, end = self._base.get(gram, (0, 0))
+        docs = self._postings[start:end]
+        extra = self._extra.get(gram)
+        if extra:
+            docs = np.union1d(docs, _array(extra))
+        return docs
+
+    def _docs_with_any(self, grams):
+        docs = [self._docs_with(g) for g in grams]
+        return np.unique(np.concatenate(docs)) if docs else EMPTY
+
+    def _live(self, docs):
+        if self._dead:
+            docs = docs[~np.isin(docs, _array(self._dead))]
+        return docs
+
+    # Matching documents and their rank tier:
+    # 0 exact ID, 1 a field starts with the query, 2 a word does, 3 any other substring
+    def _matches(self, query):
+        if len(query) >= 3:
+            postings = sorted((self._docs_with(g) for g in _trigrams(query)), key=len)
+            candidates = postings[0]
+            for docs in postings[1:]:
+                candidates = np.intersect1d(candidates, docs, assume_unique=True)
+            docs, tiers = [], []
+            for doc in self._live(candidates).tolist():
+                text = _document(self._docs[doc])
+                if query in text:
+                    docs.append(doc)
+                    tiers.append(1 if SEPARATOR + query in text else 2 if " " + query in text else 3)
+            docs, tiers = np.asarray(docs, dtype=np.int32), np.asarray(tiers)
+        else:
+            # Every trigram containing a short query is a real substring, so no verification is needed
+            grams = [g for g in self._grams() if query in g]
+            docs = self._live(self._docs_with_any(grams))
+            tiers = np.full(len(docs), 3)
+            tiers[np.isin(docs, self._docs_with_any(g for g in grams if g.startswith(" " + query)))] = 2
+            tiers[np.isin(docs, self._docs_with_any(g for g in grams if g.startswith(SEPARATOR + query)))] = 1
+        exact = self._id_docs.get(query)
+        if exact is not None:
+            tiers[docs == exact] = 0
+        return docs, tiers
+
+    # Documents sharing at least FUZZY_THRESHOLD of the query's trigrams, most similar first
+    def _fuzzy(self, query):
+        grams = _trigrams(query)
+        docs = [self._docs_with(g) for g in grams]
+        docs, counts = np.unique(np.concatenate(docs), return_counts=True)
+        keep = counts >= FUZZY_THRESHOLD * len(grams)
+        docs, counts = docs[keep], counts[keep]
+        live = ~np.isin(docs, _array(self._dead))
+        return docs[live], -counts[live]
+
+    # Return (ranked product IDs for the page, total matches); ties are ordered by product name
+    def search(self, query, offset=0, limit=50, fuzzy=False):
+        query = query.strip().lower()
+        if not query:
+            return [], 0
+        with self._lock:
+            docs, tiers = self._fuzzy(query) if fuzzy and len(query) >= 3 else self._matches(query)
+            order = pd.DataFrame({
+                "tier": tiers,
+                "name": [self._docs[doc][1] for doc in docs.tolist()],
+            }).sort_values(["tier", "name"], kind="stable").index[offset:offset + limit]
+            return [self._product_ids[doc] for doc in docs[order].tolist()], len(docs)
@@ -0,0 +1,550 @@
+import os
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+from ledger import open_ledger
+from locking import FileLock
+
+# Storage engines behind load_inventory/save_inventory/load_sales/save_sales/register_change.
+#
+# CsvEngine keeps the original files (inventory.csv plus the append-only sales
+# and history ledgers). SqliteEngine keeps everything in one WAL-mode database
+# so concurrent Streamlit sessions get transactional updates. ParquetEngine
+# (parquet_storage.py, needs pyarrow) keeps inventory and sales as typed
+# Parquet files. The engine is chosen with the INVENTORY_STORAGE environment
+# variable ("csv", "sqlite" or "parquet"). The CSV and Parquet engines hold a
+# FileLock (locking.py) around each read-modify-write, so the app and cli.py
+# jobs in other processes do not lose each other's writes.
+
+INVENTORY_COLUMNS = ["ID", "Product", "Category", "Quantity", "Price", "Supplier", "Last Update", "Estimated Demand"]
+SALES_COLUMNS = ["Date", "ID", "Product", "Quantity Sold", "Unit Price", "Total", "User"]
+HISTORY_COLUMNS = ["Date", "Action", "Product ID", "User"]
+# Quantities are held as int32 in memory (see core.py), so stock cannot exceed this
+MAX_QUANTITY = 2 ** 31 - 1
+
+
+class ProductNotFound(Exception):
+    pass
+
+
+class InsufficientStock(Exception):
+    def __init__(self, available):
+        super().__init__(f"Not enough stock. Available: {available}")
+        self.available = available
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class StorageEngine:
+    # True if load_sales filters at the source rather than after reading everything
+    pushdown = False
+
+    # Token that changes whenever "inventory", "sales" or "history" changes; used to cache loads
+    def version(self, dataset):
+        raise NotImplementedError
+
+    def has_inventory(self):
+        raise NotImplementedError
+
+    def load_inventory(self):
+        raise NotImplementedError
+
+    def save_inventory(self, df):
+        raise NotImplementedError
+
+    # Replace the inventory with an iterable of DataFrame chunks, atomically
+    def save_inventory_chunks(self, chunks):
+        raise NotImplementedError
+
+    # Add the rows of an iterable of DataFrame chunks to the inventory, atomically
+    def append_inventory_chunks(self, chunks):
+        raise NotImplementedError
+
+    def update_product(self, product_id, values):
+        raise NotImplementedError
+
+    # Set Estimated Demand from a Series indexed by ID, leaving every other column (and products
+    # not in it) as they are now, so stock changes made while the forecast ran are kept
+    def save_demand(self, demand):
+        raise NotImplementedError
+
+    # Add Quantity to existing products and set Price where given (deltas: ID, Quantity, Price or NaN),
+    # atomically and with one history entry for the whole batch
+    def apply_stock_update(self, deltas, action, user):
+        raise NotImplementedError
+
+    def delete_product(self, product_id):
+        raise NotImplementedError
+
+    def has_sales(self):
+        raise NotImplementedError
+
+    # Sales, optionally only some columns and sales with start <= Date < end
+    def load_sales(self, columns=None, start=None, end=None):
+        raise NotImplementedError
+
+    def save_sales(self, df):
+        raise NotImplementedError
+
+    # Decrement stock, record the sale and log it as one unit; returns the sale row
+    # (SALES_COLUMNS plus the product's Category)
+    def record_sale(self, product_id, quantity, user):
+        raise NotImplementedError
+
+    def register_changes(self, action, product_ids, user):
+        raise NotImplementedError
+
+    def count_changes(self):
+        raise NotImplementedError
+
+    # History rows [start, stop) in insertion order
+    def read_changes(self, start, stop):
+        raise NotImplementedError
+
+
+class CsvEngine(StorageEngine):
+    def __init__(self, inventory_file, sales_file, history_file):
+        self.inventory_file = inventory_file
+        self.sales = open_ledger(sales_file, SALES_COLUMNS, dtype={"ID": str}, parse_dates=["Date"])
+        self.history = open_ledger(history_file, HISTORY_COLUMNS, dtype={"Product ID": str})
+        # Serializes read-modify-write of inventory.csv, also with other processes (see locking.py)
+        self._lock = FileLock(inventory_file + ".lock")
+        self._inventory_generation = 0
+
+    def version(self, dataset):
+        if dataset == "sales":
+            return self.sales.version()
+        if dataset == "history":
+            return self.history.version()
+        try:
+            stat = os.stat(self.inventory_file)
+            return self._inventory_generation, stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return self._inventory_generation, None
+
+    def has_inventory(self):
+        return os.path.exists(self.inventory_file)
+
+    def load_inventory(self):
+        return pd.read_csv(self.inventory_file, dtype={"ID": str})
+
+    def save_inventory(self, df):
+        with self._lock:
+            tmp = self.inventory_file + ".tmp"
+            df.to_csv(tmp, index=False)
+            os.replace(tmp, self.inventory_file)
+            self._inventory_generation += 1
+
+    def _write_chunks(self, chunks, append):
+        with self._lock:
+            tmp = self.inventory_file + ".tmp"
+            columns = INVENTORY_COLUMNS
+            if append and self.has_inventory():
+                columns = pd.read_csv(self.inventory_file, nrows=0).columns.tolist()
+                shutil.copyfile(self.inventory_file, tmp)
+            else:
+                pd.DataFrame(columns=columns).to_csv(tmp, index=False)
+            with open(tmp, "a", newline="", encoding="utf-8") as f:
+                for chunk in chunks:
+                    chunk.reindex(columns=columns).to_csv(f, header=False, index=False)
+            os.replace(tmp, self.inventory_file)
+            self._inventory_generation += 1
+
+    def save_inventory_chunks(self, chunks):
+        self._write_chunks(chunks, append=False)
+
+    def append_inventory_chunks(self, chunks):
+        self._write_chunks(chunks, append=True)
+
+    # Inventory indexed by ID, for single-product read-modify-write
+    def _load_indexed(self, product_id):
+        inventory = self.load_inventory()
+        inventory.index = pd.Index(inventory["ID"], name=None)
+        if product_id not in inventory.index:
+            raise ProductNotFound(product_id)
+        return inventory
+
+    def update_product(self, product_id, values):
+        with self._lock:
+            inventory = self._load_indexed(product_id)
+            for column, value in values.items():
+                inventory.at[product_id, column] = value
+            self.save_inventory(inventory)
+
+    def save_demand(self, demand):
+        with self._lock:
+            inventory = self.load_inventory()
+            current = inventory["Estimated Demand"] if "Estimated Demand" in inventory.columns else 0.0
+            inventory["Estimated Demand"] = inventory["ID"].astype(str).map(demand).fillna(current)
+            self.save_inventory(inventory)
+
+    def apply_stock_update(self, deltas, action, user):
+        with self._lock:
+            inventory = self.load_inventory()
+            position = pd.Index(inventory["ID"].astype(str)).get_indexer(deltas["ID"].astype(str))
+            if (position == -1).any():
+                raise ProductNotFound(deltas["ID"][position == -1].iloc[0])
+            # int64, so a large delta cannot wrap (Parquet loads Quantity as int32)
+            quantity = inventory["Quantity"].to_numpy(dtype="int64", copy=True)
+            quantity[position] += deltas["Quantity"].to_numpy()
+            if (quantity < 0).any():
+                raise _negative_stock(inventory["ID"][quantity < 0].tolist())
+            if (quantity > MAX_QUANTITY).any():
+                raise _excess_stock(inventory["ID"][quantity > MAX_QUANTITY].tolist())
+            price = deltas["Price"].to_numpy()
+            has_price = ~pd.isna(price)
+            inventory["Quantity"] = quantity
+            inventory.iloc[position[has_price], inventory.columns.get_loc("Price")] = price[has_price]
+            inventory.iloc[position, inventory.columns.get_loc("Last Update")] = _now()
+            self.save_inventory(inventory)
+            # One history append with a row per product
+            self.register_changes(action, deltas["ID"].astype(str).tolist(), user)
+
+    def delete_product(self, product_id):
+        with self._lock:
+            self.save_inventory(self._load_indexed(product_id).drop(index=product_id))
+
+    def has_sales(self):
+        return self.sales.exists()
+
+    def load_sales(self, columns=None, start=None, end=None):
+        # Date is parsed by the ledger (stored as "YYYY-MM-DD HH:MM:SS" text)
+        df = self.sales.load()
+        if start is not None:
+            df = df[df["Date"] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df["Date"] < pd.Timestamp(end)]
+        return df[columns] if columns else df
+
+    def save_sales(self, df):
+        self.sales.replace(df)
+
+    def record_sale(self, product_id, quantity, user):
+        with self._lock:
+            inventory = self._load_indexed(product_id)
+            product = inventory.loc[product_id]
+            if product["Quantity"] < quantity:
+                raise InsufficientStock(product["Quantity"])
+            date = _now()
+            inventory.at[product_id, "Quantity"] -= quantity
+            inventory.at[product_id, "Last Update"] = date
+            self.save_inventory(inventory)
+            sale = {"Date": date, "ID": product_id, "Product": product["Product"], "Quantity Sold": quantity,
+                    "Unit Price": round(float(product["Price"]), 2),
+                    "Total": round(quantity * float(product["Price"]), 2), "User": user}
+            try:
+                self.sales.append([sale])
+            except Exception:
+                # The sale was not written: put the stock back
+                inventory.at[product_id, "Quantity"] = product["Quantity"]
+                inventory.at[product_id, "Last Update"] = product["Last Update"]
+                self.save_inventory(inventory)
+                raise
+            sale["Category"] = product["Category"]
+            self.register_changes("Sale", [product_id], user)
+            return sale
+
+    def register_changes(self, action, product_ids, user):
+        date = _now()
+        self.history.append([
+            {"Date": date, "Action": action, "Product ID": product_id, "User": user}
+            for product_id in product_ids
+        ])
+
+    def count_changes(self):
+        return self.history.count() if self.history.exists() else 0
+
+    def read_changes(self, start, stop):
+        return self.history.read_range(start, stop)
+
+
+def _negative_stock(ids):
+    shown = ", ".join(str(product_id) for product_id in ids[:10])
+    return ValueError(f"Stock would become negative for {len(ids)} product(s): {shown}.")
+
+
+def _excess_stock(ids):
+    shown = ", ".join(str(product_id) for product_id in ids[:10])
+    return ValueError(f"Stock would exceed {MAX_QUANTITY} for {len(ids)} product(s): {shown}.")
+
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _columns_sql(columns):
+    return ", ".join(_quote(c) for c in columns)
+
+
+class SqliteEngine(StorageEngine):
+    pushdown = True
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS inventory (
+            "ID" TEXT PRIMARY KEY,
+            "Product" TEXT,
+            "Category" TEXT,
+            "Quantity" INTEGER NOT NULL,
+            "Price" REAL NOT NULL,
+            "Supplier" TEXT,
+            "Last Update" TEXT,
+            "Estimated Demand" REAL NOT NULL DEFAULT 0.0
+        );
+        CREATE TABLE IF NOT EXISTS sales (
+            "Date" TEXT NOT NULL,
+            "ID" TEXT NOT NULL,
+            "Product" TEXT,
+            "Quantity Sold" INTEGER NOT NULL,
+            "Unit Price" REAL NOT NULL,
+            "Total" REAL NOT NULL,
+            "User" TEXT
+        );
+        CREATE INDEX IF NOT EXISTS sales_id ON sales ("ID");
+        CREATE INDEX IF NOT EXISTS sales_date ON sales ("Date");
+        CREATE TABLE IF NOT EXISTS history (
+            "Date" TEXT NOT NULL,
+            "Action" TEXT NOT NULL,
+            "Product ID" TEXT,
+            "User" TEXT
+        );
+        CREATE INDEX IF NOT EXISTS history_date ON history ("Date");
+        CREATE INDEX IF NOT EXISTS history_product ON history ("Product ID");
+        CREATE TABLE IF NOT EXISTS generations (
+            "Dataset" TEXT PRIMARY KEY,
+            "Generation" INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO generations VALUES ('inventory', 0), ('sales', 0), ('history', 0);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+
+    # One connection per thread; Streamlit runs each session in its own thread
+    def _connection(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    @contextmanager
+    def _transaction(self):
+        con = self._connection()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            yield con
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("COMMIT")
+
+    # Every write transaction bumps the generation of the datasets it touches
+    def _bump(self, con, *datasets):
+        con.executemany('UPDATE generations SET "Generation" = "Generation" + 1 WHERE "Dataset" = ?',
+                        [(d,) for d in datasets])
+
+    def version(self, dataset):
+        return self._connection().execute('SELECT "Generation" FROM generations WHERE "Dataset" = ?', (dataset,)).fetchone()[0]
+
+    def _read(self, query, params=(), columns=None):
+        cur = self._connection().execute(query, params)
+        names = [d[0] for d in cur.description]
+        return pd.DataFrame(cur.fetchall(), columns=names).reindex(columns=columns or names)
+
+    # Like the CSV file existing: the dataset has been saved at least once, even if it is now empty.
+    # Every write bumps the generation, so a generation above 0 means it was written.
+    def _exists(self, table):
+        return self.version(table) > 0 or self._connection().execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is not None
+
+    def _insert(self, con, table, columns, df):
+        rows = df.reindex(columns=columns).astype(object).where(df.reindex(columns=columns).notna(), None)
+        placeholders = ", ".join("?" * len(columns))
+        con.executemany(f"INSERT INTO {table} ({_columns_sql(columns)}) VALUES ({placeholders})",
+                        rows.itertuples(index=False, name=None))
+
+    def has_inventory(self):
+        return self._exists("inventory")
+
+    def load_inventory(self):
+        return self._read(f"SELECT {_columns_sql(INVENTORY_COLUMNS)} FROM inventory ORDER BY rowid", columns=INVENTORY_COLUMNS)
+
+    def save_inventory(self, df):
+        df = df.copy()
+        df["ID"] = df["ID"].astype(str)
+        with self._transaction() as con:
+            con.execute("DELETE FROM inventory")
+            self._insert(con, "inventory", INVENTORY_COLUMNS, df)
+            self._bump(con, "inventory")
+
+    def save_inventory_chunks(self, chunks):
+        with self._transaction() as con:
+            con.execute("DELETE FROM inventory")
+            for chunk in chunks:
+                self._insert(con, "inventory", INVENTORY_COLUMNS, chunk.astype({"ID": str}))
+            self._bump(con, "inventory")
+
+    def append_inventory_chunks(self, chunks):
+        with self._transaction() as con:
+            for chunk in chunks:
+                self._insert(con, "inventory", INVENTORY_COLUMNS, chunk.astype({"ID": str}))
+            self._bump(con, "inventory")
+
+    def update_product(self, product_id, values):
+        assignments = ", ".join(f"{_quote(c)} = ?" for c in values)
+        with self._transaction() as con:
+            cur = con.execute(f"UPDATE inventory SET {assignments} WHERE \"ID\" = ?", list(values.values()) + [product_id])
+            if cur.rowcount == 0:
+                raise ProductNotFound(product_id)
+            self._bump(con, "inventory")
+
+    def save_demand(self, demand):
+        with self._transaction() as con:
+            con.executemany('UPDATE inventory SET "Estimated Demand" = ? WHERE "ID" = ?',
+                            zip(demand.astype(float).tolist(), demand.index.astype(str).tolist()))
+            self._bump(con, "inventory")
+
+    def apply_stock_update(self, deltas, action, user):
+        date = _now()
+        with self._transaction() as con:
+            con.execute('CREATE TEMP TABLE IF NOT EXISTS stock_update ("ID" TEXT PRIMARY KEY, "Quantity" INTEGER, "Price" REAL)')
+            con.execute("DELETE FROM stock_update")
+            self._insert(con, "stock_update", ["ID", "Quantity", "Price"], deltas.astype({"ID": str}))
+            missing = con.execute('SELECT u."ID" FROM stock_update u LEFT JOIN inventory i ON i."ID" = u."ID" '
+                                  'WHERE i."ID" IS NULL LIMIT 1').fetchone()
+            if missing is not None:
+                raise ProductNotFound(missing[0])
+            con.execute('UPDATE inventory SET "Quantity" = inventory."Quantity" + u."Quantity", '
+                        '"Price" = COALESCE(u."Price", inventory."Price"), "Last Update" = ? '
+                        'FROM stock_update u WHERE inventory."ID" = u."ID"', (date,))
+            negative = con.execute('SELECT "ID" FROM inventory WHERE "Quantity" < 0 '
+                                   'AND "ID" IN (SELECT "ID" FROM stock_update)').fetchall()
+            if negative:
+                raise _negative_stock([row[0] for row in negative])
+            excess = con.execute('SELECT "ID" FROM inventory WHERE "Quantity" > ? '
+                                 'AND "ID" IN (SELECT "ID" FROM stock_update)', (MAX_QUANTITY,)).fetchall()
+            if excess:
+                raise _excess_stock([row[0] for row in excess])
+            con.execute('INSERT INTO history ("Date", "Action", "Product ID", "User") '
+                        'SELECT ?, ?, "ID", ? FROM stock_update ORDER BY rowid', (date, action, user))
+            con.execute("DELETE FROM stock_update")
+            self._bump(con, "inventory", "history")
+
+    def delete_product(self, product_id):
+        with self._transaction() as con:
+            if con.execute('DELETE FROM inventory WHERE "ID" = ?', (product_id,)).rowcount == 0:
+                raise ProductNotFound(product_id)
+            self._bump(con, "inventory")
+
+    def has_sales(self):
+        return self._exists("sales")
+
+    def load_sales(self, columns=None, start=None, end=None):
+        columns = columns or SALES_COLUMNS
+        conditions, params = [], []
+        if start is not None:
+            conditions.append('"Date" >= ?')
+            params.append(pd.Timestamp(start).strftime("%Y-%m-%d %H:%M:%S"))
+        if end is not None:
+            conditions.append('"Date" < ?')
+            params.append(pd.Timestamp(end).strftime("%Y-%m-%d %H:%M:%S"))
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        return self._read(f"SELECT {_columns_sql(columns)} FROM sales {where}ORDER BY rowid", params, columns=columns)
+
+    def save_sales(self, df):
+        with self._transaction() as con:
+            con.execute("DELETE FROM sales")
+            self._insert(con, "sales", SALES_COLUMNS, df)
+            self._bump(con, "sales")
+
+    def record_sale(self, product_id, quantity, user):
+        date = _now()
+        with self._transaction() as con:
+            row = con.execute('SELECT "Product", "Quantity", "Price", "Category" FROM inventory WHERE "ID" = ?',
+                              (product_id,)).fetchone()
+            if row is None:
+                raise ProductNotFound(product_id)
+            name, available, price, category = row
+            if available < quantity:
+                raise InsufficientStock(available)
+            con.execute('UPDATE inventory SET "Quantity" = "Quantity" - ?, "Last Update" = ? WHERE "ID" = ?',
+                        (quantity, date, product_id))
+            sale = {"Date": date, "ID": product_id, "Product": name, "Quantity Sold": quantity,
+                    "Unit Price": round(price, 2), "Total": round(quantity * price, 2), "User": user}
+            con.execute(f"INSERT INTO sales ({_columns_sql(SALES_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [sale[c] for c in SALES_COLUMNS])
+            sale["Category"] = category
+            con.execute('INSERT INTO history ("Date", "Action", "Product ID", "User") VALUES (?, ?, ?, ?)',
+                        (date, "Sale", product_id, user))
+            self._bump(con, "inventory", "sales", "history")
+        return sale
+
+    def register_changes(self, action, product_ids, user):
+        date = _now()
+        with self._transaction() as con:
+            con.executemany('INSERT INTO history ("Date", "Action", "Product ID", "User") VALUES (?, ?, ?, ?)',
+                            [(date, action, str(product_id), user) for product_id in product_ids])
+            self._bump(con, "history")
+
+    # History is append-only, so rowids are contiguous and double as row numbers
+    def count_changes(self):
+        return self._connection().execute("SELECT COALESCE(MAX(rowid), 0) FROM history").fetchone()[0]
+
+    def read_changes(self, start, stop):
+        return self._read(f"SELECT {_columns_sql(HISTORY_COLUMNS)} FROM history WHERE rowid > ? AND rowid <= ? ORDER BY rowid",
+                          (start, stop), columns=HISTORY_COLUMNS)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+# Shared engine for the process, selected by INVENTORY_STORAGE
+def get_engine(inventory_file, sales_file, history_file):
+    kind = os.environ.get("INVENTORY_STORAGE", "csv")
+    db_file = os.environ.get("INVENTORY_DB", "inventory.db")
+    parquet_dir = os.environ.get("INVENTORY_PARQUET_DIR", "inventory_data")
+    key = (kind, os.path.abspath(inventory_file), os.path.abspath(db_file), os.path.abspath(parquet_dir))
+    with _engines_lock:
+        if key not in _engines:
+            if kind == "csv":
+                _engines[key] = CsvEngine(inventory_file, sales_file, history_file)
+            elif kind == "sqlite":
+                _engines[key] = SqliteEngine(db_file)
+            elif kind == "parquet":
+                from parquet_storage import ParquetEngine
+                _engines[key] = ParquetEngine(parquet_dir, history_file)
+            else:
+                raise ValueError(f"Unknown INVENTORY_STORAGE '{kind}' (expected 'csv', 'sqlite' or 'parquet').")
+        return _engines[key]
+
+
+# Import the CSV files into a SQLite database in a single transaction
+def migrate_csv_to_sqlite(inventory_file, sales_file, history_file, db_file):
+    source = CsvEngine(inventory_file, sales_file, history_file)
+    target = SqliteEngine(db_file)
+    if target.has_inventory() or target.has_sales() or target.count_changes():
+        raise ValueError(f"The database '{db_file}' already contains data.")
+    inventory = source.load_inventory() if source.has_inventory() else pd.DataFrame(columns=INVENTORY_COLUMNS)
+    if "Estimated Demand" not in inventory.columns:
+        inventory["Estimated Demand"] = 0.0
+    inventory["Estimated Demand"] = inventory["Estimated Demand"].fillna(0.0)
+    inventory["ID"] = inventory["ID"].astype(str)
+    sales = source.load_sales() if source.has_sales() else pd.DataFrame(columns=SALES_COLUMNS)
+    if pd.api.types.is_datetime64_any_dtype(sales["Date"]):
+        sales["Date"] = sales["Date"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    history = source.history.load() if source.history.exists() else pd.DataFrame(columns=HISTORY_COLUMNS)
+    with target._transaction() as con:
+        target._insert(con, "inventory", INVENTORY_COLUMNS, inventory)
+        target._insert(con, "sales", SALES_COLUMNS, sales)
+        target._insert(con, "history", HISTORY_COLUMNS, history)
+        target._bump(con, "inventory", "sales", "history")
+    return len(inventory), len(sales), len(history)
+
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+from storage import INVENTORY_COLUMNS, SALES_COLUMNS
+
+# Synthetic inventory and sales for trying the app and for benchmark.py.
+#
+# Each product sells on a given day with its own probability, drawn from a
+# Beta distribution skewed towards sparse (intermittent) demand, scaled by a
+# weekday pattern, and sells 1 + Poisson(size) units when it does. A share
+# of the products is launched partway through the period, so they have
+# short histories. Stock levels cover between 0 and MAX_COVER_DAYS days of
+# each product's demand plus a few units, so some products are out of stock
+# or below their reorder point. All draws come from generators seeded with
+# `seed`, so the same parameters give the same data.
+
+CATEGORIES = ["Electronics", "Clothing", "Food", "Furniture", "Lighting", "Tools", "Toys", "Garden",
+              "Kitchen", "Office", "Sports", "Health"]
+ADJECTIVES = ["Basic", "Compact", "Deluxe", "Eco", "Classic", "Smart", "Heavy", "Mini", "Pro", "Soft",
+              "Steel", "Wooden", "Wireless", "Portable", "Large"]
+NOUNS = ["Lamp", "Chair", "Cable", "Shirt", "Kettle", "Drill", "Ball", "Notebook", "Rice", "Bulb", "Table",
+         "Hammer", "Blender", "Backpack", "Speaker", "Mug", "Charger", "Jacket", "Shelf", "Pan"]
+SUPPLIERS = 50
+USERS = ["admin", "clerk1", "clerk2", "clerk3"]
+# Relative sales probability Monday..Sunday
+WEEKDAY_FACTORS = [0.9, 0.85, 0.9, 1.0, 1.2, 1.4, 0.75]
+# Share of products launched partway through the period
+LAUNCHED_SHARE = 0.2
+MAX_COVER_DAYS = 60
+# Sales happen between these hours
+OPEN_HOUR, CLOSE_HOUR = 8, 20
+
+
+def _rng(seed):
+    return np.random.default_rng(seed)
+
+
+# Per product daily sale probability and mean extra units per sale
+def _demand_profile(rng, products):
+    probability = np.clip(rng.beta(0.6, 3.0, products), 0.005, 0.95)
+    size = rng.lognormal(0.0, 0.75, products) - 0.5
+    return probability, np.maximum(size, 0.0)
+
+
+# N products with the inventory columns; `end` is the last day of the sales period
+def generate_inventory(products, seed=0, end=None):
+    rng = _rng(seed)
+    end = pd.Timestamp(end).normalize() if end is not None else pd.Timestamp.now().normalize() - pd.Timedelta(days=1)
+    probability, size = _demand_profile(rng, products)
+    ids = pd.Series(np.arange(1, products + 1)).map(("P{:0%dd}" % max(len(str(products)), 6)).format)
+    names = (pd.Series(np.array(ADJECTIVES)[rng.integers(0, len(ADJECTIVES), products)]) + " "
+             + pd.Series(np.array(NOUNS)[rng.integers(0, len(NOUNS), products)]) + " "
+             + pd.Series(rng.integers(1, 1000, products)).astype(str))
+    # A few suppliers deliver most products
+    supplier = np.minimum(rng.zipf(1.6, products), SUPPLIERS)
+    daily_demand = probability * (1 + size)
+    last_update = end - pd.to_timedelta(rng.integers(0, 30 * 86400, products), unit="s")
+    return pd.DataFrame({
+        "ID": ids,
+        "Product": names,
+        "Category": np.array(CATEGORIES)[rng.integers(0, len(CATEGORIES), products)],
+        "Quantity": (np.round(daily_demand * rng.uniform(0, MAX_COVER_DAYS, products)) + rng.poisson(2, products)).astype("int64"),
+        "Price": np.round(rng.lognormal(3.0, 1.0, products), 2),
+        "Supplier": pd.Series(supplier).map("Supplier {:03d}".format),
+        "Last Update": last_update.strftime("%Y-%m-%d %H:%M:%S"),
+        "Estimated Demand": 0.0,
+    })[INVENTORY_COLUMNS]
+
+
+# M days of sales of the products of generate_inventory(products, seed, end), ending on `end`, in time order
+def generate_sales(inventory, days, seed=0, end=None):
+    rng = _rng(seed)
+    end = pd.Timestamp(end).normalize() if end is not None else pd.Timestamp.now().normalize() - pd.Timedelta(days=1)
+    products = len(inventory)
+    # Same draws as generate_inventory, so the stock levels match the demand
+    probability, size = _demand_profile(rng, products)
+    sales_rng = _rng([seed, 1])
+    launched = np.where(sales_rng.random(products) < LAUNCHED_SHARE, sales_rng.integers(0, days, products), 0)
+    ids = inventory["ID"].to_numpy()
+    names = inventory["Product"].to_numpy()
+    prices = inventory["Price"].to_numpy(dtype=float)
+    start = end - pd.Timedelta(days=days - 1)
+    frames = []
+    for day in range(days):
+        date = start + pd.Timedelta(days=day)
+        sold = (sales_rng.random(products) < probability * WEEKDAY_FACTORS[date.weekday()]) & (launched <= day)
+        # Products sell in random order through the day
+        rows = sales_rng.permutation(np.flatnonzero(sold))
+        quantity = 1 + sales_rng.poisson(size[rows])
+        seconds = np.sort(sales_rng.integers(OPEN_HOUR * 3600, CLOSE_HOUR * 3600, len(rows)))
+        frames.append(pd.DataFrame({
+            "Date": (date + pd.to_timedelta(seconds, unit="s")).strftime("%Y-%m-%d %H:%M:%S"),
+            "ID": ids[rows],
+            "Product": names[rows],
+            "Quantity Sold": quantity,
+            "Unit Price": prices[rows],
+            "Total": np.round(quantity * prices[rows], 2),
+            "User": np.array(USERS)[sales_rng.integers(0, len(USERS), len(rows))],
+        }))
+    if not frames:
+        return pd.DataFrame(columns=SALES_COLUMNS)
+    return pd.concat(frames, ignore_index=True)[SALES_COLUMNS]
+
+
+# Inventory of N products and M days of sales
+def generate(products, days, seed=0, end=None):
+    inventory = generate_inventory(products, seed, end)
+    return inventory, generate_sales(inventory, days, seed, end)
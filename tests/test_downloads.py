@@ -0,0 +1,32 @@
+import io
+import pandas as pd
+import pytest
+import core
+from instrumentation import RECORDER
+
+download_data_util = pytest.importorskip("streamlit.runtime.download_data_util")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("INVENTORY_STORAGE", "csv")
+    return core.load_inventory()
+
+
+# What Streamlit does with the value returned by a deferred download_button callable
+def download(data):
+    return download_data_util.convert_data_to_bytes_and_infer_mime(data, RuntimeError("unsupported download data"))[0]
+
+
+def test_inventory_csv_is_accepted_as_download_data(store):
+    data = download(core.inventory_csv(store, chunk_rows=2))
+    df = pd.read_csv(io.BytesIO(data), dtype={"ID": str})
+    assert df["ID"].tolist() == store["ID"].tolist()
+    assert df["Price"].tolist() == (store["Price"] / core.PRICE_CENTS).tolist()
+
+
+def test_other_downloads_are_accepted(store):
+    assert download(core.restock_csv())
+    assert download(RECORDER.json_lines()) is not None
+    assert download(RECORDER.prometheus_text())
@@ -0,0 +1,130 @@
+import os
+import threading
+import pandas as pd
+import pytest
+import ledger
+from ledger import AppendLedger, PENDING_SUFFIX, SEGMENT_SUFFIX
+
+COLUMNS = ["Date", "ID", "Quantity"]
+
+
+def rows(start, stop):
+    return [{"Date": f"2025-01-01 00:{n // 60 % 60:02d}:{n % 60:02d}", "ID": f"P{n:05d}", "Quantity": n}
+            for n in range(start, stop)]
+
+
+def make_ledger(tmp_path, **kwargs):
+    return AppendLedger(str(tmp_path / "sales.csv"), COLUMNS, dtype={"ID": str}, **kwargs)
+
+
+# Leave the tail rotated into a pending file that was not converted into a segment yet
+def rotate_to_pending(book):
+    finish = book._finish_compaction
+    book._finish_compaction = lambda pending: setattr(book, "_compacting", False)
+    book.compact()
+    book._finish_compaction = finish
+
+
+def test_concurrent_appends_are_all_written_once(tmp_path):
+    book = make_ledger(tmp_path)
+    threads = [threading.Thread(target=lambda t=t: [book.append(rows(n, n + 1)) for n in range(t * 100, t * 100 + 100)])
+               for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    df = book.load()
+    assert len(df) == 800
+    assert sorted(df["Quantity"]) == list(range(800))
+    assert book.count() == 800
+
+
+def test_compaction_keeps_rows_and_order(tmp_path):
+    book = make_ledger(tmp_path, compact_rows=10 ** 9, parse_dates=["Date"])
+    book.append(rows(0, 50))
+    book.compact()
+    book.append(rows(50, 80))
+    book.compact()
+    book.append(rows(80, 90))
+    names = sorted(os.listdir(book.segment_dir))
+    assert names == ["000001" + SEGMENT_SUFFIX, "000002" + SEGMENT_SUFFIX]
+    df = book.load()
+    assert df["Quantity"].tolist() == list(range(90))
+    assert df["ID"].iloc[0] == "P00000"
+    assert pd.api.types.is_datetime64_any_dtype(df["Date"])
+
+
+def test_compaction_runs_once_the_tail_is_large(tmp_path):
+    book = make_ledger(tmp_path, compact_rows=20)
+    for n in range(0, 60, 5):
+        book.append(rows(n, n + 5))
+    # Background compactions finish on their own; wait for the last one
+    while book._compacting or any(name.endswith(PENDING_SUFFIX) for name in os.listdir(book.segment_dir)):
+        threading.Event().wait(0.01)
+    assert any(name.endswith(SEGMENT_SUFFIX) for name in os.listdir(book.segment_dir))
+    assert book.load()["Quantity"].tolist() == list(range(60))
+
+
+@pytest.mark.parametrize("stride", [4, 1024])
+def test_read_range_across_segments_pending_and_tail(tmp_path, monkeypatch, stride):
+    monkeypatch.setattr(ledger, "INDEX_STRIDE", stride)
+    book = make_ledger(tmp_path, compact_rows=10 ** 9)
+    book.append(rows(0, 7))
+    book.compact()
+    book.append(rows(7, 12))
+    rotate_to_pending(book)
+    book.append(rows(12, 30))
+    assert sorted(os.listdir(book.segment_dir)) == ["000001" + SEGMENT_SUFFIX, "000002" + PENDING_SUFFIX]
+    assert book.count() == 30
+    expected = book.load()
+    for start in range(0, 32, 3):
+        for stop in range(start, 33, 4):
+            pd.testing.assert_frame_equal(book.read_range(start, stop), expected.iloc[start:stop].reset_index(drop=True),
+                                          check_dtype=False, check_index_type=False)
+
+
+def test_torn_last_line_is_ignored_then_repaired(tmp_path):
+    book = make_ledger(tmp_path)
+    book.append(rows(0, 5))
+    with open(book.path, "ab") as f:
+        f.write(b"2025-01-01 00:00:05,P000")
+    assert book.load()["Quantity"].tolist() == list(range(5))
+    assert book.count() == 5
+    book.append(rows(5, 7))
+    assert book.load()["Quantity"].tolist() == list(range(7))
+    with open(book.path, "rb") as f:
+        assert b"P000\n" not in f.read()
+
+
+def test_failed_write_raises_for_every_waiter_and_is_not_written(tmp_path):
+    book = make_ledger(tmp_path)
+    book.append(rows(0, 2))
+    write_rows = book._write_rows
+    release = threading.Event()
+
+    def failing(batch):
+        release.wait()
+        raise OSError("disk full")
+
+    book._write_rows = failing
+    errors = []
+
+    def append(n):
+        try:
+            book.append(rows(n, n + 1))
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=append, args=(n,)) for n in range(2, 12)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 10
+
+    # Later appends succeed, and do not see the earlier failure
+    book._write_rows = write_rows
+    book.append(rows(12, 13))
+    book.flush()
+    assert book.load()["Quantity"].tolist() == [0, 1, 12]
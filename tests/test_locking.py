@@ -0,0 +1,62 @@
+import os
+import multiprocessing
+import pandas as pd
+import pytest
+import locking
+from ledger import AppendLedger
+
+pytestmark = pytest.mark.skipif(locking.fcntl is None, reason="inter-process locks need fcntl")
+
+SALES_PER_PROCESS = 20
+
+
+def sell(directory, product_id):
+    os.chdir(directory)
+    import core
+    for _ in range(SALES_PER_PROCESS):
+        core.record_sale(product_id, 1, f"process {os.getpid()}")
+
+
+def forecast(directory):
+    os.chdir(directory)
+    import core
+    for n in range(SALES_PER_PROCESS):
+        core.engine().save_demand(pd.Series({"001": float(n)}))
+
+
+def append(path, first):
+    book = AppendLedger(path, ["N"], compact_rows=25)
+    for n in range(first, first + 200, 10):
+        book.append([{"N": i} for i in range(n, n + 10)])
+        book.compact()
+
+
+def run(processes):
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+
+@pytest.mark.parametrize("storage", ["csv", "parquet"])
+def test_sales_from_several_processes_are_all_kept(tmp_path, monkeypatch, storage):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("INVENTORY_STORAGE", storage)
+    import core
+    before = core.load_inventory().loc["003", "Quantity"]
+    sales = len(core.load_sales())
+    context = multiprocessing.get_context("spawn")
+    run([context.Process(target=sell, args=(str(tmp_path), "003")) for _ in range(2)]
+        + [context.Process(target=forecast, args=(str(tmp_path),))])
+    core._cache.clear()
+    assert core.load_inventory().loc["003", "Quantity"] == before - 2 * SALES_PER_PROCESS
+    assert len(core.load_sales()) == sales + 2 * SALES_PER_PROCESS
+
+
+def test_ledger_rotation_from_several_processes_keeps_every_row(tmp_path):
+    path = str(tmp_path / "change_history.csv")
+    context = multiprocessing.get_context("spawn")
+    run([context.Process(target=append, args=(path, first)) for first in (0, 1000, 2000)])
+    book = AppendLedger(path, ["N"])
+    assert sorted(book.load()["N"]) == sorted(n for first in (0, 1000, 2000) for n in range(first, first + 200))
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+import core
+from synthetic import generate
+from rollups import SalesRollups, ROLLUPS
+from replenishment import Replenishment
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("INVENTORY_STORAGE", "csv")
+    # Sales run up to today, so new sales extend the last day instead of starting a new one
+    inventory, sales = generate(300, 60, seed=1, end=pd.Timestamp.now())
+    core.engine().save_inventory(inventory)
+    core.engine().save_sales(sales)
+    core._rollups.version = None
+    core._replenishment.version = None
+    core._replenishment._stats = None
+    return inventory, sales
+
+
+# Products to sell: random in-stock ones, plus one that had no sales yet
+def products_to_sell(inventory, sales, count, seed=0):
+    in_stock = inventory.loc[inventory["Quantity"] > 2, "ID"]
+    chosen = list(np.random.default_rng(seed).choice(in_stock.to_numpy(), count))
+    unsold = in_stock[~in_stock.isin(sales["ID"])]
+    return chosen + unsold.iloc[:1].tolist()
+
+
+def test_incremental_sales_match_a_fresh_rebuild(store):
+    inventory, sales = store
+    core.sales_rollups()
+    core.replenishment()
+    for product_id in products_to_sell(inventory, sales, 40):
+        core.record_sale(product_id, 1, "test")
+        # The sale was applied to the current rollups and plan, not left for a rebuild
+        assert core._rollups.version == core.engine().version("sales")
+        assert core._replenishment.version == core._plan_version()
+
+    version = core._plan_version()
+    rollups = SalesRollups()
+    rollups.rebuild(core.load_sales(), core.load_inventory()["Category"], version[1])
+    for name in ROLLUPS:
+        pd.testing.assert_frame_equal(core.sales_rollups().frame(name), rollups.frame(name), check_exact=False)
+
+    plan = Replenishment()
+    plan.refresh(core.load_inventory(), lambda: rollups.frame("product_daily"), version)
+    ids = inventory["ID"].tolist()
+    pd.testing.assert_frame_equal(core.replenishment().rows(ids), plan.rows(ids), check_exact=False)
+    pd.testing.assert_frame_equal(core.restock_list(), plan.restock_list(), check_exact=False)
+
+
+def test_todays_sales_match_the_full_history(store):
+    inventory, sales = store
+    today = pd.Timestamp.now().normalize()
+    core.sales_on(today)
+    for product_id in products_to_sell(inventory, sales, 10, seed=1):
+        core.record_sale(product_id, 1, "test")
+    listed = core.sales_on(today)
+    history = core.load_sales()
+    expected = history[(history["Date"] >= today) & (history["Date"] < today + pd.Timedelta(days=1))]
+    pd.testing.assert_frame_equal(listed.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
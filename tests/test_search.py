@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from search import SearchIndex, SEARCH_FIELDS
+from synthetic import generate_inventory
+
+QUERIES = ["a", "p0", "la", "lamp", "p00012", "steel ham", "supplier 001", "mug 1", "renamed", "zzz"]
+
+
+# Product IDs whose ID, name or supplier contains the query, ignoring case
+def expected_matches(inventory, query):
+    text = inventory[SEARCH_FIELDS].astype(str).apply(lambda column: column.str.lower())
+    found = np.zeros(len(inventory), dtype=bool)
+    for field in SEARCH_FIELDS:
+        found |= text[field].str.contains(query.lower(), regex=False).to_numpy()
+    return set(inventory["ID"][found])
+
+
+def assert_matches(index, inventory):
+    for query in QUERIES:
+        ids, total = index.search(query, limit=len(inventory))
+        assert set(ids) == expected_matches(inventory, query), query
+        assert total == len(ids)
+
+
+def test_incremental_edits_and_deletes_match_str_contains():
+    inventory = generate_inventory(1000, seed=2)
+    index = SearchIndex()
+    index.refresh(inventory, 0)
+    assert_matches(index, inventory)
+    rng = np.random.default_rng(0)
+    for version in range(1, 6):
+        inventory = inventory.copy()
+        rows = rng.choice(len(inventory), 20, replace=False)
+        inventory.iloc[rows[:8], inventory.columns.get_loc("Product")] = [f"Renamed Lamp {version}-{n}" for n in range(8)]
+        inventory.iloc[rows[8:12], inventory.columns.get_loc("Supplier")] = f"Supplier 9{version}"
+        inventory = inventory.drop(index=inventory.index[rows[12:]])
+        added = pd.DataFrame({"ID": [f"N{version}{n}" for n in range(3)], "Product": [f"New Mug {n}" for n in range(3)],
+                              "Supplier": "Supplier 001"})
+        inventory = pd.concat([inventory, added], ignore_index=True)
+        index.refresh(inventory, version)
+        # Changes went into the deltas, not a rebuild
+        assert index._dead
+        assert_matches(index, inventory)
+
+
+def test_rebuild_after_many_changes_matches_str_contains():
+    inventory = generate_inventory(200, seed=3)
+    index = SearchIndex()
+    index.refresh(inventory, 0)
+    inventory = inventory.copy()
+    inventory["Product"] = "Renamed " + inventory["Product"]
+    index.refresh(inventory, 1)
+    assert not index._dead
+    assert_matches(index, inventory)
@@ -0,0 +1,72 @@
+import io
+import pandas as pd
+import pytest
+import core
+from storage import ProductNotFound, MAX_QUANTITY
+
+
+@pytest.fixture(params=["csv", "sqlite", "parquet"])
+def engine(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("INVENTORY_STORAGE", request.param)
+    core.load_inventory()
+    return core.engine()
+
+
+def snapshot(engine):
+    return engine.load_inventory(), engine.count_changes()
+
+
+def assert_unchanged(engine, before):
+    inventory, changes = before
+    pd.testing.assert_frame_equal(engine.load_inventory(), inventory)
+    assert engine.count_changes() == changes
+
+
+def deltas(ids, quantities, prices=None):
+    return pd.DataFrame({"ID": ids, "Quantity": quantities, "Price": prices or [None] * len(ids)})
+
+
+def test_applies_quantities_and_prices_with_one_history_row_per_id(engine):
+    before, changes = snapshot(engine)
+    engine.apply_stock_update(deltas(["003", "001"], [5, -2], [None, 9.5]), "Restock", "tester")
+    after = engine.load_inventory().set_index("ID")
+    before = before.set_index("ID")
+    assert after.loc["003", "Quantity"] == before.loc["003", "Quantity"] + 5
+    assert after.loc["001", "Quantity"] == before.loc["001", "Quantity"] - 2
+    # An empty Price keeps the old one
+    assert after.loc["003", "Price"] == before.loc["003", "Price"]
+    assert after.loc["001", "Price"] == 9.5
+    assert after.loc["002"].equals(before.loc["002"])
+    history = engine.read_changes(changes, engine.count_changes())
+    assert history["Product ID"].tolist() == ["003", "001"]
+    assert (history["Action"] == "Restock").all() and (history["User"] == "tester").all()
+
+
+def test_missing_id_changes_nothing(engine):
+    before = snapshot(engine)
+    with pytest.raises(ProductNotFound):
+        engine.apply_stock_update(deltas(["001", "999"], [5, 5]), "Restock", "tester")
+    assert_unchanged(engine, before)
+
+
+def test_negative_stock_changes_nothing(engine):
+    before = snapshot(engine)
+    with pytest.raises(ValueError, match="negative"):
+        engine.apply_stock_update(deltas(["001", "002"], [5, -1000], [1.0, 1.0]), "Restock", "tester")
+    assert_unchanged(engine, before)
+
+
+def test_stock_above_the_maximum_changes_nothing(engine):
+    before = snapshot(engine)
+    with pytest.raises(ValueError, match="exceed"):
+        engine.apply_stock_update(deltas(["001"], [MAX_QUANTITY]), "Restock", "tester")
+    assert_unchanged(engine, before)
+
+
+def test_empty_feed_is_a_no_op(engine):
+    before = snapshot(engine)
+    staged = core.stage_stock_upload(io.StringIO("ID,Quantity\n"))
+    assert staged.rows == 0 and staged.error_count == 0
+    core.commit_stock_upload(staged, "tester")
+    assert_unchanged(engine, before)